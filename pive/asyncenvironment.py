@@ -0,0 +1,162 @@
+# Copyright (c) 2014 - 2015, David Bothe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# -*- coding: utf-8 -*-
+""" The asynchronous environment offers the methods of the environment
+to asyncio applications. It requires Python 3.7 and keeps the context
+of the last load per asyncio task. """
+import asyncio
+import threading
+from collections import deque
+from .environment import Environment, import_chart_module, _chart_modules
+from .visualization import defaults as default
+
+
+class AsyncEnvironment(Environment):
+    """An environment with asynchronous methods to load, choose and
+    render. Their blocking work runs in an executor, so that the event
+    loop stays responsive."""
+
+    def __init__(self, inputmanager=None, outputpath=default.output_path,
+                 cache=None, executor=None, concurrency=None):
+        """ The asynchronous methods run their work in the executor, by
+        default the one of the event loop, and at most 'concurrency' of
+        them at once if it is given. """
+        Environment.__init__(self, inputmanager, outputpath, cache)
+        self.__executor = executor
+        self.__limit = None
+        self.set_concurrency(concurrency)
+
+    def set_executor(self, executor):
+        """Set the executor of the asynchronous methods. None
+        uses the default executor of the event loop."""
+        self.__executor = executor
+
+    def set_concurrency(self, concurrency):
+        """Set the maximum number of asynchronous loads and renders
+        running at once, on all event loops together. None removes
+        the limit."""
+        if concurrency is None:
+            self.__limit = None
+        else:
+            self.__limit = _SharedSemaphore(concurrency)
+
+    async def aload(self, source, dataformat=None, query=None):
+        """Asynchronous load. Reading and processing the data
+        runs in the executor without blocking the event loop."""
+        context = await self.__run_in_executor(self.load_context, source,
+                                               dataformat, query)
+        self.set_context(context)
+        return context.get_suitables()
+
+    async def achoose(self, chart):
+        """Asynchronous choose. A chart module that was not
+        imported yet is imported in the executor."""
+        context = self.get_context()
+        if chart in context.get_suitables() and chart not in _chart_modules:
+            await self.__run_in_executor(import_chart_module, chart)
+        return context.choose(chart)
+
+    async def arender(self, chart):
+        """Asynchronous render. Generating and writing the
+        files runs in the executor."""
+        await self.__run_in_executor(self.render, chart)
+
+    async def arender_code(self, chart):
+        """Asynchronous render_code. Generating the code
+        runs in the executor."""
+        return await self.__run_in_executor(self.render_code, chart)
+
+    async def __run_in_executor(self, function, *args):
+        """Runs a function in the executor, waiting for a free slot
+        first if the concurrency is limited."""
+        loop = asyncio.get_running_loop()
+        limit = self.__limit
+        if limit is None:
+            return await loop.run_in_executor(self.__executor, function,
+                                              *args)
+        await limit.acquire()
+        try:
+            return await loop.run_in_executor(self.__executor, function,
+                                              *args)
+        finally:
+            limit.release()
+
+
+class _SharedSemaphore(object):
+    """A semaphore shared by the event loops of many threads. Unlike an
+    asyncio.Semaphore it is not bound to a loop, and unlike a threading
+    semaphore a task waits for a slot on its own loop without blocking
+    a thread. A released slot is handed to the longest waiting task."""
+
+    def __init__(self, value):
+        self.__value = value
+        self.__lock = threading.Lock()
+        self.__waiters = deque()
+
+    async def acquire(self):
+        """Waits for a free slot and takes it."""
+        loop = asyncio.get_running_loop()
+        with self.__lock:
+            if self.__value > 0:
+                self.__value -= 1
+                return
+            waiter = loop.create_future()
+            self.__waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self.__lock:
+                if (loop, waiter) in self.__waiters:
+                    self.__waiters.remove((loop, waiter))
+                    raise
+            # The slot was handed over already. If the handover is still
+            # pending, it passes the slot on when it finds the waiter
+            # cancelled.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Frees a slot, handing it to a waiting task if there is one.
+        It may be called from any thread."""
+        while True:
+            with self.__lock:
+                if not self.__waiters:
+                    self.__value += 1
+                    return
+                loop, waiter = self.__waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(self.__hand_over, waiter)
+            except RuntimeError:
+                # The loop of the waiter is closed.
+                continue
+            return
+
+    def __hand_over(self, waiter):
+        """Gives the slot to a waiter on its own loop."""
+        if waiter.done():
+            self.release()
+        else:
+            waiter.set_result(None)
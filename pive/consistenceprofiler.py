@@ -23,6 +23,36 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import multiprocessing
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .dataset import Dataset, COLUMN_OBJECT
+
+# Visualization types of the datapoints.
+TYPE_NUMBER = 'number'
+TYPE_STRING = 'string'
+TYPE_TIME = 'time'
+
+_NUMBER_TYPES = (int, float)
+
+# Profiling modes. The sample mode checks the head, the tail and a
+# random sample of the datapoints. The parallel mode checks all
+# datapoints in chunks using a pool of processes.
+PROFILE_FULL = 'full'
+PROFILE_SAMPLE = 'sample'
+PROFILE_PARALLEL = 'parallel'
+
+# Number of datapoints checked in sample mode.
+SAMPLE_HEAD_SIZE = 1000
+SAMPLE_TAIL_SIZE = 1000
+SAMPLE_RANDOM_SIZE = 1000
+# Number of datapoints checked by a worker process at once.
+PARALLEL_CHUNK_SIZE = 250000
+# Number of chunks submitted to each process ahead of time.
+PARALLEL_CHUNKS_PER_PROCESS = 2
+
+
 def get_datapoint_types(datapoint):
     """Determines the datas visualization-types of a given datapoint.
 	Valid visualization-types are 'number', 'string' and 'time'"""
@@ -45,7 +75,7 @@ def get_datapoint_types(datapoint):
             try:
                 if isinstance(item, basestring):
                     types.append("string")
-            except TypeError:
+            except (TypeError, NameError):
                 pass
 
     return types
@@ -54,7 +84,7 @@ def get_datapoint_types(datapoint):
 def is_float(value):
     try:
         number = float(value)
-    except ValueError:
+    except (TypeError, ValueError):
         return False
     else:
         return True
@@ -64,15 +94,18 @@ def is_int(value):
     try:
         num_a = float(value)
         num_b = int(num_a)
-    except ValueError:
+    except (TypeError, ValueError, OverflowError):
         return False
     else:
         return num_a == num_b
 
 
-def is_dataset_consistent(input_data):
+def is_dataset_consistent(input_data, mode=PROFILE_FULL, processes=None):
     """Checks the consistency of the dataset. Each item
 	must contain the exact datapoint-type as the other."""
+    if isinstance(input_data, Dataset):
+        return check_consistency(input_data, mode, processes) is None
+
     if input_data:
         current = get_datapoint_types(input_data[0])
         for item in input_data[1:]:
@@ -82,3 +115,193 @@ def is_dataset_consistent(input_data):
                 return False
     return True
 
+
+def is_time_key(key):
+    """Checks if a key names a time column."""
+    key = str(key)
+    return key.endswith("date") or key.endswith("time")
+
+
+def get_value_type(value):
+    """Determines the visualization-type of a single value."""
+    if is_float(value) or is_int(value):
+        return TYPE_NUMBER
+    if isinstance(value, str):
+        return TYPE_STRING
+    return None
+
+
+def get_column_roles(dataset):
+    """Determines the visualization-type of each column from the keys
+	and the column types of the dataset. Object columns are typed by
+	their first value that is not null."""
+    roles = []
+    for key, column_type in zip(dataset.keys(), dataset.column_types()):
+        if is_time_key(key) or dataset.is_time_column(key):
+            roles.append(TYPE_TIME)
+        elif column_type != COLUMN_OBJECT:
+            roles.append(TYPE_NUMBER)
+        else:
+            first = next(iter(dataset.present_values(key)), None)
+            roles.append(get_value_type(first) if first is not None
+                         else None)
+    return roles
+
+
+def get_dataset_types(dataset):
+    """Returns the visualization-types of the datapoints of a dataset.
+	A column holding only nulls has no type, which no visualization
+	accepts."""
+    if isinstance(dataset, Dataset):
+        return get_column_roles(dataset)
+    return get_datapoint_types(dataset[0])
+
+
+def find_inconsistent_row(dataset):
+    """Returns the index of the first datapoint whose types differ from
+	the first datapoint, or None if the dataset is consistent. The roles
+	are determined once per column, then each object column is checked
+	with a type-specialised scan that stops at the first mismatch."""
+    first = None
+    # Time columns and typed number columns are consistent.
+    for key, column_type, role in _get_object_columns(dataset):
+        column = dataset.column(key)
+        if first is not None:
+            column = column[:first]
+        index = find_column_mismatch(column, role, dataset.is_typed())
+        if index is not None and (first is None or index < first):
+            first = index
+    return first
+
+
+def find_column_mismatch(column, role, typed=False):
+    """Returns the index of the first value in a column that is not of the
+	given visualization-type, or None. In typed columns a string is never
+	a number, so strings need no conversion to be checked. Nulls match
+	every type."""
+    if role == TYPE_NUMBER:
+        for index, value in enumerate(column):
+            if type(value) in _NUMBER_TYPES or value is None:
+                continue
+            if typed or get_value_type(value) != TYPE_NUMBER:
+                return index
+    elif role == TYPE_STRING:
+        for index, value in enumerate(column):
+            if type(value) is str:
+                if typed or not (is_float(value) or is_int(value)):
+                    continue
+                return index
+            if value is not None and get_value_type(value) != TYPE_STRING:
+                return index
+    else:
+        for index, value in enumerate(column):
+            if value is not None and get_value_type(value) != role:
+                return index
+    return None
+
+
+def check_consistency(dataset, mode=PROFILE_FULL, processes=None):
+    """Checks a dataset in the given profiling mode and returns the index
+	of the first inconsistent datapoint found, or None. The sample mode
+	may miss inconsistent datapoints."""
+    if mode == PROFILE_FULL:
+        return find_inconsistent_row(dataset)
+    if mode == PROFILE_SAMPLE:
+        return find_inconsistent_sample(dataset)
+    if mode == PROFILE_PARALLEL:
+        return find_inconsistent_row_parallel(dataset, processes)
+    raise ValueError("Unknown profiling mode: %s" % mode)
+
+
+def get_sample_indices(length, head=SAMPLE_HEAD_SIZE, tail=SAMPLE_TAIL_SIZE,
+                       size=SAMPLE_RANDOM_SIZE, rng=random):
+    """Returns the sorted indices of the head, the tail and
+	a random sample of the remaining datapoints."""
+    if length <= head + tail + size:
+        return list(range(length))
+    middle = range(head, length - tail)
+    indices = list(range(head))
+    indices.extend(sorted(rng.sample(middle, size)))
+    indices.extend(range(length - tail, length))
+    return indices
+
+
+def find_inconsistent_sample(dataset, indices=None):
+    """Like find_inconsistent_row, but only checks the datapoints
+	at the given indices, by default a sample of the dataset."""
+    if indices is None:
+        indices = get_sample_indices(len(dataset))
+    first = None
+    for key, column_type, role in _get_object_columns(dataset):
+        column = dataset.column(key)
+        values = [column[index] for index in indices]
+        position = find_column_mismatch(values, role, dataset.is_typed())
+        if position is not None:
+            index = indices[position]
+            if first is None or index < first:
+                first = index
+    return first
+
+
+def find_inconsistent_row_parallel(dataset, processes=None,
+                                   chunk_size=PARALLEL_CHUNK_SIZE):
+    """Like find_inconsistent_row, but the datapoints are checked in
+	chunks by a pool of processes. Small datasets are checked directly."""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    columns = _get_object_columns(dataset)
+    length = len(dataset)
+    if not columns or processes < 2 or length <= chunk_size:
+        return find_inconsistent_row(dataset)
+
+    typed = dataset.is_typed()
+    jobs = ((start, [(role, dataset.column(key)[start:start + chunk_size])
+                     for key, column_type, role in columns], typed)
+            for start in range(0, length, chunk_size))
+
+    # Chunks are sliced and submitted lazily, at most a few per process
+    # at once. The chunks are checked in order, so the first mismatch
+    # found is the first one of the dataset and the rest is cancelled.
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers=processes)
+    try:
+        for job in jobs:
+            pending.append(executor.submit(_check_chunk, job))
+            if len(pending) < processes * PARALLEL_CHUNKS_PER_PROCESS:
+                continue
+            index = pending.popleft().result()
+            if index is not None:
+                return index
+        while pending:
+            index = pending.popleft().result()
+            if index is not None:
+                return index
+        return None
+    finally:
+        # Chunks after a mismatch are dropped without waiting for them.
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=not pending)
+
+
+def _get_object_columns(dataset):
+    """Returns key, column type and role of each column that
+	needs to be checked value by value."""
+    return [(key, column_type, role) for key, column_type, role
+            in zip(dataset.keys(), dataset.column_types(),
+                   get_column_roles(dataset))
+            if role != TYPE_TIME and column_type == COLUMN_OBJECT]
+
+
+def _check_chunk(job):
+    """Worker function: returns the index of the first
+	mismatch within a chunk of columns."""
+    start, columns, typed = job
+    first = None
+    for role, column in columns:
+        if first is not None:
+            column = column[:first]
+        index = find_column_mismatch(column, role, typed)
+        if index is not None and (first is None or index < first):
+            first = index
+    return None if first is None else start + first
@@ -0,0 +1,163 @@
+# Copyright (c) 2014 - 2015, David Bothe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+""" The dataset cache keeps validated datasets on disk together with
+their suitable visualizations. Entries are keyed by the fingerprint of
+the source file, so unchanged sources are loaded without being read,
+validated, profiled and mapped again. The cache is bounded in size and
+evicts the least recently used entries. """
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+# Increment whenever the layout of cached entries changes.
+CACHE_VERSION = 5
+# Default upper bound of the cache directory in bytes.
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+# Number of bytes hashed at once.
+HASH_BLOCK_SIZE = 1024 * 1024
+# Number of file hashes remembered by a cache instance.
+MAX_REMEMBERED_HASHES = 1024
+# File extension of cache entries.
+ENTRY_EXTENSION = '.pivecache'
+
+
+class DatasetCache(object):
+    """Size bounded on-disk cache of loaded datasets."""
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.__directory = directory
+        self.__max_size = max_size
+        self.__lock = threading.Lock()
+        # Content hashes of the files seen by this process,
+        # keyed by path, size and modification time.
+        self.__hashes = {}
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get_key(self, source, settings=()):
+        """Returns the cache key of a source file or None if the
+        source is not a file. The key covers path, size, modification
+        time and content of the file as well as the given settings."""
+        try:
+            path = os.path.realpath(source)
+            stat = os.stat(path)
+        except (TypeError, ValueError, OSError):
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        filekey = (path, stat.st_size, stat.st_mtime)
+        digest = self.__hashes.get(filekey)
+        if digest is None:
+            digest = hash_file(path)
+            if len(self.__hashes) >= MAX_REMEMBERED_HASHES:
+                self.__hashes.clear()
+            self.__hashes[filekey] = digest
+
+        key = repr((CACHE_VERSION, filekey, digest, tuple(settings)))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Returns the cached (dataset, suitables, has_datefields)
+        entry of a key or None on a cache miss."""
+        path = self.__entry_path(key)
+        try:
+            with open(path, 'rb') as fp:
+                entry = pickle.load(fp)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # Mark the entry as recently used.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, dataset, suitables, has_datefields):
+        """Stores an entry and evicts the least recently used
+        entries if the cache exceeds its size."""
+        entry = (dataset, suitables, has_datefields)
+        fd, temppath = tempfile.mkstemp(dir=self.__directory)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(entry, fp, pickle.HIGHEST_PROTOCOL)
+            os.replace(temppath, self.__entry_path(key))
+        except Exception:
+            if os.path.exists(temppath):
+                os.remove(temppath)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the
+        cache fits into its maximum size."""
+        with self.__lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.__directory):
+                if not name.endswith(ENTRY_EXTENSION):
+                    continue
+                path = os.path.join(self.__directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= self.__max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        for name in os.listdir(self.__directory):
+            if name.endswith(ENTRY_EXTENSION):
+                os.remove(os.path.join(self.__directory, name))
+        self.__hashes.clear()
+
+    def __entry_path(self, key):
+        return os.path.join(self.__directory, key + ENTRY_EXTENSION)
+
+
+def hash_file(path):
+    """Returns the SHA-1 digest of the content of a file."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,343 @@
+# Copyright (c) 2014 - 2015, David Bothe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+""" The dataset stores the validated data column by column.
+The keys are kept once for the whole dataset and each column
+is held in a compact buffer. Rows are provided as lightweight
+views to keep the datapoint access of the visualizations. """
+from array import array
+from collections.abc import Mapping
+from itertools import compress
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Column types of the dataset.
+COLUMN_INT = 'int'
+COLUMN_FLOAT = 'float'
+COLUMN_OBJECT = 'object'
+
+# Typecodes of the buffers holding numerical columns.
+_TYPECODES = {COLUMN_INT: 'q', COLUMN_FLOAT: 'd'}
+# Marks a column of integers and floats while its type is determined.
+_MIXED_NUMBERS = 'mixed'
+# Integers beyond this bound are not exactly representable as floats.
+_MAX_EXACT_FLOAT = 2 ** 53
+
+
+def compact_column(values):
+    """Stores the values of a column in the most compact buffer
+    possible. Returns the buffer, the column type and the value
+    mask of the column. Columns mixing integers and floats are
+    stored as floats if the integers are exactly representable.
+    Nulls (None) do not affect the column type and are held as
+    zero in numerical buffers."""
+    column_type = None
+    has_nulls = False
+    for value in values:
+        value_type = type(value)
+        if value_type is int:
+            value_type = COLUMN_INT
+        elif value_type is float:
+            value_type = COLUMN_FLOAT
+        elif value is None:
+            has_nulls = True
+            continue
+        else:
+            column_type = COLUMN_OBJECT
+            break
+        if column_type is None:
+            column_type = value_type
+        elif column_type != value_type:
+            column_type = _MIXED_NUMBERS
+
+    if column_type == _MIXED_NUMBERS:
+        column_type = COLUMN_FLOAT
+        for value in values:
+            if type(value) is int and not (-_MAX_EXACT_FLOAT <= value <=
+                                           _MAX_EXACT_FLOAT):
+                column_type = COLUMN_OBJECT
+                break
+
+    mask = None
+    if has_nulls or (column_type == COLUMN_OBJECT and None in values):
+        mask = value_mask(values)
+    if column_type in _TYPECODES:
+        if mask is not None:
+            values = [0 if value is None else value for value in values]
+        try:
+            return array(_TYPECODES[column_type], values), column_type, mask
+        except OverflowError:
+            if mask is not None:
+                values = [value if present else None
+                          for value, present in zip(values, mask)]
+    return list(values), COLUMN_OBJECT, mask
+
+
+def value_mask(values):
+    """Returns the value mask of a column: a bytearray holding 1
+    for each present value and 0 for each null. The mask selects
+    the present values with itertools.compress."""
+    return bytearray(value is not None for value in values)
+
+
+class Dataset(object):
+    """Columnar storage of a validated dataset."""
+
+    def __init__(self, keys, columns, column_types=None, typed=False,
+                 time_keys=(), masks=None):
+        """Creates a dataset from its keys and a sequence for each
+        column. Columns should be built with compact_column. Typed
+        datasets were converted by their reader, so none of their
+        strings represents a number. The columns named in time_keys
+        hold timestamps in milliseconds since the epoch. The masks
+        hold the value mask of each column containing nulls and None
+        for the others."""
+        if len(keys) != len(columns):
+            raise ValueError("Each key requires exactly one column.")
+        self.__keys = tuple(keys)
+        self.__index = dict((key, i) for i, key in enumerate(self.__keys))
+        self.__columns = list(columns)
+        if column_types is None:
+            column_types = [_column_type_of(column) for column in columns]
+        self.__column_types = list(column_types)
+        self.__length = len(columns[0]) if columns else 0
+        self.__typed = typed
+        self.__time_keys = frozenset(time_keys)
+        if masks is None:
+            masks = [None] * len(self.__columns)
+        self.__masks = list(masks)
+
+    @classmethod
+    def from_records(cls, records, keys=None):
+        """Creates a dataset from a sequence of key/value pairs sharing
+        the same keys. The keys default to those of the first record."""
+        records = iter(records)
+        values = []
+        if keys is None:
+            for first in records:
+                keys = list(first.keys())
+                values.append([first[key] for key in keys])
+                break
+            else:
+                return cls([], [])
+
+        values.extend([record[key] for key in keys] for record in records)
+        columns = [compact_column(column) for column
+                   in (zip(*values) if values else [()] * len(keys))]
+        return cls(keys, [column[0] for column in columns],
+                   [column[1] for column in columns],
+                   masks=[column[2] for column in columns])
+
+    def keys(self):
+        """Returns the keys shared by all datapoints."""
+        return self.__keys
+
+    def column(self, key):
+        """Returns the buffer of the column stored under key. Nulls
+        are held as zero in numerical buffers, see value_mask."""
+        return self.__columns[self.__index[key]]
+
+    def column_at(self, position):
+        """Returns the buffer of the column at the given position."""
+        return self.__columns[position]
+
+    def columns(self):
+        """Returns the buffers of all columns in key order."""
+        return list(self.__columns)
+
+    def column_type(self, key):
+        """Returns the storage type of the column stored under key."""
+        return self.__column_types[self.__index[key]]
+
+    def column_types(self):
+        """Returns the storage types of all columns in key order."""
+        return list(self.__column_types)
+
+    def value_mask(self, key):
+        """Returns the value mask of the column stored under key,
+        or None if the column contains no nulls."""
+        return self.__masks[self.__index[key]]
+
+    def value_masks(self):
+        """Returns the value masks of all columns in key order."""
+        return list(self.__masks)
+
+    def null_count(self, key):
+        """Returns the number of nulls in the column stored under key."""
+        mask = self.value_mask(key)
+        return 0 if mask is None else len(mask) - mask.count(1)
+
+    def present_values(self, key):
+        """Returns an iterable over the values of a column, skipping
+        its nulls."""
+        mask = self.value_mask(key)
+        column = self.column(key)
+        return column if mask is None else compress(column, mask)
+
+    def is_typed(self):
+        """Returns true if the strings of the dataset are known
+        not to represent numbers."""
+        return self.__typed
+
+    def time_keys(self):
+        """Returns the keys of the columns holding timestamps."""
+        return self.__time_keys
+
+    def is_time_column(self, key):
+        """Returns true if the column holds timestamps."""
+        return key in self.__time_keys
+
+    def replace_columns(self, replacements, time_keys=()):
+        """Returns a new dataset in which the columns named in the
+        replacements mapping are replaced by (buffer, column type,
+        value mask) triples. The other buffers are shared with this
+        dataset."""
+        columns = list(self.__columns)
+        column_types = list(self.__column_types)
+        masks = list(self.__masks)
+        for key, (column, column_type, mask) in replacements.items():
+            position = self.__index[key]
+            columns[position] = column
+            column_types[position] = column_type
+            masks[position] = mask
+        return Dataset(self.__keys, columns, column_types, self.__typed,
+                       self.__time_keys.union(time_keys), masks)
+
+    def column_as_numpy(self, key):
+        """Returns a column as NumPy array. Numerical columns
+        share their buffer with the dataset. Columns containing
+        nulls are returned as masked arrays."""
+        if numpy is None:
+            raise ImportError("NumPy is required to export columns.")
+        column = self.column(key)
+        if isinstance(column, array):
+            exported = numpy.frombuffer(column, dtype=column.typecode)
+        else:
+            exported = numpy.array(column, dtype=object)
+        mask = self.value_mask(key)
+        if mask is None:
+            return exported
+        nulls = numpy.frombuffer(mask, dtype=numpy.uint8) == 0
+        return numpy.ma.masked_array(exported, mask=nulls)
+
+    def value_at(self, position, index):
+        """Returns the value of the column at position in the
+        datapoint at index, or None if it is null."""
+        mask = self.__masks[position]
+        if mask is not None and not mask[index]:
+            return None
+        return self.__columns[position][index]
+
+    def row_values(self, index):
+        """Returns the values of the datapoint at index."""
+        values = [column[index] for column in self.__columns]
+        for position, mask in enumerate(self.__masks):
+            if mask is not None and not mask[index]:
+                values[position] = None
+        return values
+
+    def position_of(self, key):
+        """Returns the position of a key within the datapoints."""
+        return self.__index[key]
+
+    def to_records(self):
+        """Returns the data as a list of dictionaries."""
+        keys = self.__keys
+        if not any(mask is not None for mask in self.__masks):
+            return [dict(zip(keys, values))
+                    for values in zip(*self.__columns)]
+        return [dict(zip(keys, self.row_values(i)))
+                for i in range(self.__length)]
+
+    def __len__(self):
+        return self.__length
+
+    def __bool__(self):
+        return self.__length > 0
+
+    def __iter__(self):
+        for i in range(self.__length):
+            yield Row(self, i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            columns = [column[index] for column in self.__columns]
+            masks = [None if mask is None else mask[index]
+                     for mask in self.__masks]
+            return Dataset(self.__keys, columns, self.__column_types,
+                           self.__typed, self.__time_keys, masks)
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError("Dataset index out of range.")
+        return Row(self, index)
+
+    def __repr__(self):
+        return 'Dataset(keys=%r, length=%d)' % (list(self.__keys),
+                                                 self.__length)
+
+
+class Row(Mapping):
+    """Read-only view of a single datapoint of a dataset."""
+    __slots__ = ('_dataset', '_index')
+
+    def __init__(self, dataset, index):
+        self._dataset = dataset
+        self._index = index
+
+    def keys(self):
+        return self._dataset.keys()
+
+    def values(self):
+        return self._dataset.row_values(self._index)
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def __getitem__(self, key):
+        dataset = self._dataset
+        return dataset.value_at(dataset.position_of(key), self._index)
+
+    def __iter__(self):
+        return iter(self._dataset.keys())
+
+    def __len__(self):
+        return len(self._dataset.keys())
+
+    def __repr__(self):
+        return 'Row(%r)' % self.items()
+
+
+def _column_type_of(column):
+    """Determines the type of a column buffer."""
+    if isinstance(column, array):
+        if column.typecode == _TYPECODES[COLUMN_FLOAT]:
+            return COLUMN_FLOAT
+        return COLUMN_INT
+    return COLUMN_OBJECT
@@ -23,7 +23,13 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import pickle
+import tempfile
 from collections import OrderedDict
+from .dataset import Dataset, compact_column
+
+# Number of datapoints written to the spool file at once.
+SPOOL_BATCH_SIZE = 1000
 
 
 def count_keys_in_raw_data(raw_dataset):
@@ -76,22 +82,20 @@ def generate_valid_dataset(valid_keyset, raw_dataset):
 def get_all_keys_in_dataset(raw_dataset):
     """Determines if there are keys shared by
 	the whole dataset"""
-    allKeys = []
-    for item in raw_dataset:
-        for elem in list(item.keys()):
-            if elem not in allKeys:
-                allKeys.append(elem)
-    return allKeys
+    allKeys = OrderedDict()
+    # Visit each distinct keyset once, in order of appearance.
+    for keyset in OrderedDict.fromkeys(tuple(item.keys())
+                                       for item in raw_dataset):
+        for elem in keyset:
+            allKeys[elem] = True
+    return list(allKeys.keys())
 
 
 def determine_shared_keys_in_dataset(all_keys, raw_dataset):
     """Determines if there are keys shared by
 	the whole dataset."""
-    evenKeys = all_keys
-    for item in raw_dataset:
-        # Intersection of two lists.
-        evenKeys = list(set(evenKeys) & set(list(item.keys())))
-    return evenKeys
+    keysets = set(tuple(item.keys()) for item in raw_dataset)
+    return list(intersect_keysets(keysets, all_keys))
 
 
 def generate_valid_dataset_from_shared_keys(even_keyset, raw_dataset):
@@ -106,3 +110,210 @@ def generate_valid_dataset_from_shared_keys(even_keyset, raw_dataset):
         if datapoint:
             valid_data.append(datapoint)
     return valid_data
+
+
+class ShapeTable(object):
+    """Interns the keysets of datapoints as shape ids. Datapoints
+	sharing the same keyset share the same shape id."""
+
+    def __init__(self):
+        self.__shapes = {}
+        self.keysets = []
+        self.counts = []
+
+    def add(self, item):
+        """Returns the shape id of a datapoint and counts it. Raises an
+		AttributeError if the datapoint is not a key/value pair."""
+        keyset = tuple(item.keys())
+        shape = self.__shapes.get(keyset)
+        if shape is None:
+            shape = self.__shapes[keyset] = len(self.keysets)
+            self.keysets.append(keyset)
+            self.counts.append(0)
+        self.counts[shape] += 1
+        return shape
+
+
+def intern_shapes(raw_dataset):
+    """Assigns a shape id to each datapoint in a single pass. Returns the
+	keysets and counts indexed by shape id and the shape id of each
+	datapoint, or None if a datapoint is not a key/value pair."""
+    table = ShapeTable()
+    shape_ids = []
+    for item in raw_dataset:
+        try:
+            shape_ids.append(table.add(item))
+        except AttributeError as e:
+            print ('Key counting failed. "%s" is not a key/value pair. Error: %s' % (item, e.args[0]))
+            return None
+    return table.keysets, table.counts, shape_ids
+
+
+def get_majority_shape(counts):
+    """Returns the shape id with the most occurences. Like
+	validate_data_keys the last one wins on a tie."""
+    majority = None
+    maxcount = 0
+    for shape, count in enumerate(counts):
+        if count >= maxcount:
+            maxcount = count
+            majority = shape
+    return majority
+
+
+def intersect_keysets(keysets, keys=None):
+    """Returns the set of keys contained in every keyset. Stops
+	as soon as the intersection is empty."""
+    shared = None if keys is None else set(keys)
+    for keyset in keysets:
+        if shared is None:
+            shared = set(keyset)
+        else:
+            shared.intersection_update(keyset)
+        if not shared:
+            break
+    return shared or set()
+
+
+def select_shape_positions(keysets, counts, merge=False):
+    """Selects the keys of the valid dataset. Returns the keys and, for
+	each shape id, the positions of these keys within the values of its
+	datapoints or None if the shape is rejected. Without merge, shapes
+	lacking some of the majority keys are kept with a None position for
+	each missing key. The first shape is the one of the first datapoint."""
+    if merge:
+        shared = intersect_keysets(keysets)
+        keys = [key for key in keysets[0] if key in shared]
+        positions = [[keyset.index(key) for key in keys]
+                     for keyset in keysets]
+    else:
+        majority = get_majority_shape(counts)
+        keys = list(keysets[majority])
+        positions = [None] * len(keysets)
+        for shape, keyset in enumerate(keysets):
+            if keyset and set(keyset).issubset(keys):
+                positions[shape] = [keyset.index(key) if key in keyset
+                                    else None for key in keys]
+    return keys, positions
+
+
+def build_dataset(keys, positions, rows):
+    """Builds a dataset from (shape id, values) pairs, keeping the
+	values at the selected positions of each shape. Missing keys
+	are stored as nulls."""
+    if not keys:
+        return Dataset([], [])
+
+    sparse = [selected is not None and None in selected
+              for selected in positions]
+    columns = [[] for key in keys]
+    appenders = [column.append for column in columns]
+    for shape, values in rows:
+        selected = positions[shape]
+        if selected is None:
+            continue
+        if sparse[shape]:
+            for append, position in zip(appenders, selected):
+                append(None if position is None else values[position])
+            continue
+        for append, position in zip(appenders, selected):
+            append(values[position])
+
+    columns = [compact_column(column) for column in columns]
+    return Dataset(keys, [column[0] for column in columns],
+                   [column[1] for column in columns],
+                   masks=[column[2] for column in columns])
+
+
+def validate_dataset(raw_dataset, merge=False):
+    """Validates a list of datapoints and returns a dataset. The datapoints
+	sharing the most frequent keyset are kept. With merge, all datapoints
+	are kept but reduced to the keys shared by the whole dataset."""
+    shapes = intern_shapes(raw_dataset)
+    if shapes is None or not shapes[0]:
+        return Dataset([], [])
+    keysets, counts, shape_ids = shapes
+
+    keys, positions = select_shape_positions(keysets, counts, merge)
+    rows = ((shape, list(item.values()))
+            for item, shape in zip(raw_dataset, shape_ids)
+            if positions[shape] is not None)
+    return build_dataset(keys, positions, rows)
+
+
+def validate_shaped_rows(shaped, merge=False):
+    """Validates datapoints stored as (shape id, values) pairs, e.g.
+	by the parallel readers, without interning their keysets again."""
+    if not shaped.keysets:
+        return Dataset([], [])
+    keys, positions = select_shape_positions(shaped.keysets, shaped.counts,
+                                             merge)
+    return build_dataset(keys, positions, shaped.rows)
+
+
+def validate_stream(datapoints, merge=False, batch_size=SPOOL_BATCH_SIZE):
+    """Validates a stream of datapoints like validate_dataset, but without
+	holding the raw data in memory. Each datapoint is tagged with its
+	shape id and its values are spooled to a temporary file. The valid
+	shapes are selected at the end of the stream and only the matching
+	datapoints are replayed into the dataset."""
+    table = ShapeTable()
+    with tempfile.TemporaryFile() as spool:
+        batch = []
+        for item in datapoints:
+            try:
+                shape = table.add(item)
+            except AttributeError as e:
+                print ('Key counting failed. "%s" is not a key/value pair. Error: %s' % (item, e.args[0]))
+                return Dataset([], [])
+            batch.append((shape, tuple(item.values())))
+            if len(batch) >= batch_size:
+                pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+
+        if not table.keysets:
+            return Dataset([], [])
+        keys, positions = select_shape_positions(table.keysets, table.counts,
+                                                 merge)
+        spool.seek(0)
+        return build_dataset(keys, positions, _replay_spool(spool))
+
+
+def _replay_spool(spool):
+    """Yields the (shape id, values) pairs of a spool file."""
+    while True:
+        try:
+            batch = pickle.load(spool)
+        except EOFError:
+            return
+        for row in batch:
+            yield row
+
+
+def validate_declared(datapoints, schema, merge=False):
+    """Validates datapoints against the columns declared by a schema.
+	Each datapoint is checked by its length and its keys only. With
+	merge, datapoints may hold additional keys. Datapoints lacking a
+	declared key are dropped."""
+    keys = schema.keys()
+    width = len(keys)
+    columns = [[] for key in keys]
+    appenders = [column.append for column in columns]
+    for item in datapoints:
+        try:
+            if not merge and len(item) != width:
+                continue
+            values = [item[key] for key in keys]
+        except KeyError:
+            continue
+        except (TypeError, AttributeError) as e:
+            print ('Key check failed. "%s" is not a key/value pair. Error: %s' % (item, e.args[0]))
+            return Dataset([], [])
+        for append, value in zip(appenders, values):
+            append(value)
+    # Without datapoints the columns match no declared type.
+    if not columns or not columns[0]:
+        return Dataset([], [])
+    return schema.create_dataset(columns)
@@ -28,8 +28,21 @@
  relies on a given input manager to read data before
  processing the visualizations. """
 import importlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from weakref import WeakKeyDictionary
 from .visualization import defaults as default
 
+try:
+    import contextvars
+except ImportError:
+    # Python 3.6 workaround. Without context variables
+    # the contexts are kept per thread only.
+    contextvars = None
+
 # Accessor to choose the charts. Corresponding with
 # the config files 'title' attribute in
 # pive/visualization/config
@@ -40,28 +53,78 @@ CHART_BAR = 'barchart'
 CHART_PIE = 'piechart'
 CHART_CHORD = 'chordchart'
 
+# The chart modules imported so far, shared by all environments,
+# and the seconds each took to import on its first use.
+_chart_modules = {}
+_import_times = {}
+_import_lock = threading.Lock()
+
+
+class _ThreadVariable(threading.local):
+    """Like a context variable, but separate for each thread only."""
+
+    def get(self):
+        """Returns the value of this thread or None."""
+        return getattr(self, 'value', None)
+
+    def set(self, value):
+        """Sets the value of this thread."""
+        self.value = value
+
+
+# The context of the last load of each environment. Context variables
+# are separate for each thread and each asyncio task. The environments
+# are weakly referenced, a context is dropped with its environment.
+if contextvars is not None:
+    _loaded_contexts = contextvars.ContextVar('pive_loaded_contexts',
+                                              default=None)
+else:
+    _loaded_contexts = _ThreadVariable()
+
+
+def import_chart_module(chart):
+    """Returns the module of a chart. Each module is imported once,
+    on its first use, and shared by all environments."""
+    module = _chart_modules.get(chart)
+    if module is None:
+        with _import_lock:
+            module = _chart_modules.get(chart)
+            if module is None:
+                start = time.time()
+                module = importlib.import_module('.%s' % chart,
+                                                 package=default.module_path)
+                _import_times[chart] = time.time() - start
+                _chart_modules[chart] = module
+    return module
+
+
+def get_import_times():
+    """Returns the seconds each imported chart module took to import.
+    The first import also pays for the shared dependencies, e.g. the
+    template engine, and so reports the cold start."""
+    return dict(_import_times)
+
 # Bundles all essential access methods to render visualizations.
 class Environment(object):
     """Contains all suitable visualizations. Only those
     visualizations are imported and it is not
-    allowed to render unsuited visualizations."""
-    __suitables = []
-    __data = []
-
-    # The actual visualization modules.
-    __modules = []
+    allowed to render unsuited visualizations.
 
-    __has_datefields = False
+    The environment only holds its configuration and shared state, the
+    data of each load is kept in a LoadContext. The context of the last
+    load is remembered per thread and per asyncio task, so one environment
+    can load and render concurrently in many threads and tasks. It is
+    kept until the environment is gone or clear_context is called."""
 
-    __datakeys = []
-
-
-    def __init__(self, inputmanager=None, outputpath=default.output_path):
+    def __init__(self, inputmanager=None, outputpath=default.output_path,
+                 cache=None):
         """ The Environment needs an input manager instance to work, but is
         optional at creation. Leaving the user to configure the
-        input manager first. """
+        input manager first. An optional dataset cache skips loading
+        of unchanged source files. """
         self.__inputmanager = inputmanager
         self.__outputpath = outputpath
+        self.__cache = cache
 
     def set_output_path(self, outputpath):
         """Set the output path of all visualization files."""
@@ -71,41 +134,179 @@ class Environment(object):
         """Change the internal input manager instance."""
         self.__inputmanager = inputmanager
 
+    def set_cache(self, cache):
+        """Set the dataset cache. None disables caching."""
+        self.__cache = cache
+
     # Load the dataset utilizing the internal input manager.
-    def load(self, source):
-        """Loads data from a source."""
-        try:
-            inputdata = self.__inputmanager.read(source)
-            self.__suitables = self.__inputmanager.map(inputdata)
-            self.__data = inputdata
-        except ValueError as e:
-            print ("Failed to load the dataset: %s" % e)
-            raise
-
-        self.__modules = self.import_suitable_visualizations(self.__suitables)
-        self.__has_datefields = self.__inputmanager.has_date_points()
-        # Converting the datakeys into strings.
-        self.__datakeys = [str(i) for i in list(self.__data[0].keys())]
-        return self.__suitables
+    def load(self, source, dataformat=None, query=None):
+        """Loads data from a source. The format of the source
+        is detected automatically unless it is given. Data is
+        read from SQLite databases by the given query. Returns
+        the suitable visualizations."""
+        context = self.load_context(source, dataformat, query)
+        self.set_context(context)
+        return context.get_suitables()
+
+    def load_context(self, source, dataformat=None, query=None):
+        """Like load, but returns the loaded data as a new context
+        without changing the state of the environment."""
+        inputmanager = self.__inputmanager
+        cache = self.__cache
+        key = None
+        entry = None
+        if cache is not None:
+            settings = inputmanager.get_settings() + (dataformat, query)
+            key = cache.get_key(source, settings)
+            if key is not None:
+                entry = cache.get(key)
+
+        if entry is not None:
+            data, suitables, has_datefields = entry
+        else:
+            try:
+                data = inputmanager.read(source, dataformat, query)
+                suitables, has_datefields = inputmanager.map_dataset(data)
+            except ValueError as e:
+                print ("Failed to load the dataset: %s" % e)
+                raise
+            if key is not None:
+                cache.put(key, data, suitables, has_datefields)
+
+        # Chart modules are imported on the first choice of the chart.
+        return LoadContext(data, suitables, has_datefields)
+
+    def get_context(self):
+        """Returns the context of the last load in this thread."""
+        contexts = _loaded_contexts.get()
+        context = None if contexts is None else contexts.get(self)
+        if context is None:
+            raise ValueError("No dataset loaded.")
+        return context
+
+    def set_context(self, context):
+        """Makes a context, e.g. one returned by load_context, the
+        context of the last load in this thread or asyncio task."""
+        contexts = WeakKeyDictionary(_loaded_contexts.get() or {})
+        contexts[self] = context
+        _loaded_contexts.set(contexts)
+
+    def clear_context(self):
+        """Drops the context of the last load in this thread or
+        asyncio task and with it the loaded dataset."""
+        contexts = _loaded_contexts.get()
+        if contexts is not None and self in contexts:
+            contexts = WeakKeyDictionary(contexts)
+            del contexts[self]
+            _loaded_contexts.set(contexts)
 
     @staticmethod
     def import_suitable_visualizations(suitable_visualization_list):
         """Dynamically import all suited visualization modules."""
+        return [import_chart_module(item)
+                for item in suitable_visualization_list]
 
-        mods = []
-        for item in suitable_visualization_list:
-            mod = '.%s' % item
-            mods.append(mod)
+    # Choose a chart to start modifying or render it.
+    def choose(self, chart):
+        """Choose a chart from the suitable visualizations
+        of the last load in this thread."""
+        return self.get_context().choose(chart)
 
-        modules = []
+    def render(self, chart):
+        """Renders the chart and creates
+        all files to display the visualization
+        under the environments output path."""
+        chart.create_visualization_files(self.__outputpath)
 
-        for item in mods:
-            modules.append(importlib.import_module(item,
-                                                   package=default.module_path))
+    def render_all(self, charts=None, workers=None, processes=False):
+        """Renders all suitable charts of the last load in this thread,
+        or the given ones, into the output path. The charts are rendered
+        by a pool of up to 'workers' threads, or processes if processes
+        is true. Returns a manifest with the files and the rendering time
+        of each chart and the total time. Failed charts are reported in
+        the manifest instead of raising an error."""
+        context = self.get_context()
+        if charts is None:
+            charts = context.get_suitables()
+        charts = list(charts)
+        for chart in charts:
+            if chart not in context.get_suitables():
+                raise ValueError("Visualization not possible: %s" % chart)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        workers = max(1, min(workers, len(charts)))
 
-        return modules
+        outputpath = self.__outputpath
+        # Create the folder once instead of racing in each chart.
+        if not os.path.exists(outputpath):
+            os.makedirs(outputpath)
+
+        start = time.time()
+        jobs = [(context, chart, outputpath) for chart in charts]
+        if workers == 1:
+            results = [render_chart(job) for job in jobs]
+        else:
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with pool(max_workers=workers) as executor:
+                results = list(executor.map(render_chart, jobs))
+
+        return {'outputpath': outputpath,
+                'workers': workers,
+                'processes': bool(processes) and workers > 1,
+                'seconds': time.time() - start,
+                'charts': results}
+
+    def render_code(self, chart):
+        """Renders the chart and returns the javascript
+        code and its json dataset to include the
+        visualization in another document."""
+        js = chart.get_js_code()
+        data = chart.get_json_dataset()
+        return (js, data)
+
+
+def render_chart(job):
+    """Worker function: chooses and renders a chart of a context into
+    an output path. Returns the manifest entry of the chart."""
+    context, chart, outputpath = job
+    start = time.time()
+    entry = {'chart': chart, 'files': [], 'error': None}
+    try:
+        visualization = context.choose(chart)
+        visualization.create_visualization_files(outputpath)
+    except Exception as e:
+        entry['error'] = '%s: %s' % (type(e).__name__, e)
+    else:
+        entry['files'] = ['%s/%s%s' % (outputpath, chart, extension)
+                          for extension in ('.html', '.js', '.json')]
+    entry['seconds'] = time.time() - start
+    return entry
+
+
+class LoadContext(object):
+    """The data of a single load: the dataset and its suitable
+    visualizations. A context is not changed after its creation
+    and may be shared between threads."""
+
+    def __init__(self, data, suitables, has_datefields):
+        self.__data = data
+        self.__suitables = list(suitables)
+        self.__has_datefields = has_datefields
+        # Converting the datakeys into strings.
+        self.__datakeys = [str(i) for i in list(data[0].keys())]
+
+    def get_data(self):
+        """Returns the loaded dataset."""
+        return self.__data
+
+    def get_suitables(self):
+        """Returns the suitable visualizations."""
+        return list(self.__suitables)
+
+    def has_date_points(self):
+        """Returns true if the data contains dates."""
+        return self.__has_datefields
 
-    # Choose a chart to start modifying or render it.
     def choose(self, chart):
         """Choose a chart from the suitable visualizations."""
         if chart not in self.__suitables:
@@ -115,7 +316,7 @@ class Environment(object):
         # return it to the user.
         index = self.__suitables.index(chart)
         modname = self.__suitables[index]
-        module = self.__modules[index]
+        module = import_chart_module(modname)
 
         class_ = getattr(module, "Chart")
 
@@ -127,18 +328,3 @@ class Environment(object):
 
         chart_decision.setDataKeys(self.__datakeys)
         return chart_decision
-
-
-    def render(self, chart):
-        """Renders the chart and creates
-        all files to display the visualization
-        under the environments output path."""
-        chart.create_visualization_files(self.__outputpath)
-
-    def render_code(self, chart):
-        """Renders the chart and returns the javascript
-        code and its json dataset to include the
-        visualization in another document."""
-        js = chart.get_js_code()
-        data = chart.get_json_dataset()
-        return (js, data)
@@ -31,78 +31,129 @@ from . import inputreader as reader
 from . import datavalidater as validater
 from . import consistenceprofiler as profiler
 from . import visualizationmapper as vizmapper
+from . import timeengine
+from .dataset import Dataset
 
 NOT_CONSISTENT_ERR_MSG = "Data is not consistent."
 NO_DATA_LOADED_ERR_MSG = "Unexpected data source."
+NO_VALID_DATA_ERR_MSG = "No valid datapoints found."
 
 
 class InputManager(object):
     """Contains and manages the data."""
 
     # Input Managers can try to merge false datapoints or not.
-    def __init__(self, mergedata=False):
+    # Large files are parsed by up to 'processes' worker
+    # processes, defaulting to the number of CPUs. With streaming,
+    # JSON datapoints are validated while they are read instead of
+    # loading the raw data into memory first. The profiling mode
+    # decides how thoroughly the consistency is checked. With
+    # 'parsetimes', columns of ISO-8601 strings are detected by
+    # their values and converted into timestamps, and with
+    # 'epochtimes' integer columns of epoch timestamps as well.
+    # Both are opt-in since the detection is ambiguous and times
+    # without an offset are then read as UTC instead of the local
+    # time of the browser. Otherwise only keys ending in 'date' or
+    # 'time' name time columns and their values are kept. With a
+    # schema declaring the columns, values are converted by their
+    # declared type and no type is inferred from the data.
+    def __init__(self, mergedata=False, processes=None, streaming=False,
+                 profiling=profiler.PROFILE_FULL, parsetimes=False,
+                 epochtimes=False, schema=None):
         self.__mergedata = mergedata
+        self.__processes = processes
+        self.__streaming = streaming
+        self.__profiling = profiling
+        self.__parsetimes = parsetimes
+        self.__epochtimes = epochtimes
+        self.__schema = schema
         self.__contains_datefields = False
 
-    def read(self, source):
-        """Reads the input source."""
-        inputdata = reader.load_input_source(source)
+    def read(self, source, dataformat=None, query=None):
+        """Reads the input source. The format is detected
+        automatically unless it is given, e.g. 'json' or 'csv'.
+        SQLite databases require a query selecting the data."""
+        declared_types = None
+        if self.__schema is not None:
+            declared_types = self.__schema.get_declared_types()
+        if self.__streaming:
+            inputdata = reader.iter_input_source(source, dataformat,
+                                                 self.__processes, query,
+                                                 declared_types)
+        else:
+            inputdata = reader.load_input_source(source, dataformat,
+                                                 self.__processes, query,
+                                                 declared_types)
 
         # Raise an error if the data source is empty or nor readable.
         if not inputdata:
             raise ValueError(NO_DATA_LOADED_ERR_MSG)
 
         dataset = self.__validate_input(inputdata)
+        # Raise an error if no datapoint is valid.
+        if not dataset:
+            raise ValueError(NO_VALID_DATA_ERR_MSG)
+        # Declared datasets are consistent by their conversion.
+        if self.__schema is not None:
+            return dataset
+        if self.__parsetimes:
+            dataset = timeengine.convert_time_columns(dataset,
+                                                      self.__epochtimes)
         # Raise an error if the dataset is not consistent.
-        if not self.__is_dataset_consistent(dataset):
-            raise ValueError(NOT_CONSISTENT_ERR_MSG)
+        index = profiler.check_consistency(dataset, self.__profiling,
+                                           self.__processes)
+        if index is not None:
+            raise ValueError("%s Datapoint %d differs from the first one."
+                             % (NOT_CONSISTENT_ERR_MSG, index))
 
         return dataset
 
     def map(self, dataset):
         """Maps the dataset to supported visualizations."""
+        suitables, self.__contains_datefields = self.map_dataset(dataset)
+        return suitables
+
+    def map_dataset(self, dataset):
+        """Like map, but returns the supported visualizations and whether
+        the data contains dates without changing the input manager. It
+        may be called by many threads at once."""
         viztypes = self.__get_datapoint_types(dataset)
         properties = vizmapper.get_visualization_properties(dataset, viztypes)
         suitables = vizmapper.check_possibilities(properties)
-        self.__contains_datefields = vizmapper.has_date(viztypes)
-        return suitables
+        return suitables, vizmapper.has_date(viztypes)
+
+    def get_settings(self):
+        """Returns the settings that affect the loaded dataset. The
+        profiling mode is one of them, since a sampled check may
+        accept a dataset that the full check rejects."""
+        schema = self.__schema
+        return (self.__mergedata, self.__profiling, self.__parsetimes,
+                self.__epochtimes,
+                None if schema is None else schema.signature())
 
     def has_date_points(self):
         """Returns true if the data contains dates."""
         return self.__contains_datefields
 
-    def __is_dataset_consistent(self, dataset):
-        """Checks if the dataset is consistent."""
-        consistent = profiler.is_dataset_consistent(dataset)
-        return consistent
-
     def __get_datapoint_types(self, dataset):
         """Returns all containing visualization types."""
-        viztypes = profiler.get_datapoint_types(dataset[0])
+        if self.__schema is not None:
+            return self.__schema.get_roles()
+        viztypes = profiler.get_dataset_types(dataset)
         return viztypes
 
     def __validate_input(self, inputdata):
         """Validates the input data:"""
-        validdata = []
-        if self.__mergedata:
-            validdata = self.__merged_dataset_validation(inputdata)
-        else:
-            validdata = self.__dataset_validation(inputdata)
-        return validdata
-
-    def __merged_dataset_validation(self, inputdata):
-        """Validate the data by merging all shared keys."""
-        allkeys = validater.get_all_keys_in_dataset(inputdata)
-        sharedkeys = validater.determine_shared_keys_in_dataset(allkeys,
-                                                                inputdata)
-        dataset = validater.generate_valid_dataset_from_shared_keys(sharedkeys,
-                                                                    inputdata)
-        return dataset
-
-    def __dataset_validation(self, inputdata):
-        """Validate the unmerged data by counting the keys."""
-        keycount = validater.count_keys_in_raw_data(inputdata)
-        validkeys = validater.validate_data_keys(keycount)
-        dataset = validater.generate_valid_dataset(validkeys, inputdata)
-        return dataset
-
+        # All datapoints of a dataset share the same keys.
+        if self.__schema is not None:
+            if isinstance(inputdata, Dataset):
+                return self.__schema.conform(inputdata)
+            return validater.validate_declared(inputdata, self.__schema,
+                                               self.__mergedata)
+        if isinstance(inputdata, Dataset):
+            return inputdata
+        if isinstance(inputdata, reader.ShapedRows):
+            return validater.validate_shaped_rows(inputdata, self.__mergedata)
+        if isinstance(inputdata, list):
+            return validater.validate_dataset(inputdata, self.__mergedata)
+        return validater.validate_stream(inputdata, self.__mergedata)
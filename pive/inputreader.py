@@ -25,58 +25,357 @@
 
 import json
 import csv
+import os
+import gzip
+import bz2
+import io
+import mmap
+import multiprocessing
+import sqlite3
+from array import array
 from collections import OrderedDict
-
-
-def load_input_source(input_source):
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from .dataset import Dataset, compact_column
+
+try:
+    import lzma
+except ImportError:
+    # Python may be built without the lzma module.
+    lzma = None
+
+# Supported data formats.
+FORMAT_JSON = 'json'
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMAT_SQLITE = 'sqlite'
+
+# File extensions that determine the format without reading the file.
+FORMAT_EXTENSIONS = {'.json': FORMAT_JSON,
+                     '.csv': FORMAT_CSV,
+                     '.tsv': FORMAT_CSV,
+                     '.ndjson': FORMAT_NDJSON,
+                     '.jsonl': FORMAT_NDJSON,
+                     '.sqlite': FORMAT_SQLITE,
+                     '.sqlite3': FORMAT_SQLITE,
+                     '.db': FORMAT_SQLITE}
+
+# Compressed sources are recognized by their magic bytes.
+COMPRESSION_MAGIC = ((b'\x1f\x8b', gzip),
+                     (b'BZh', bz2),
+                     (b'\xfd7zXZ\x00', lzma))
+COMPRESSION_EXTENSIONS = ('.gz', '.bz2', '.xz')
+
+# Number of bytes inspected to detect the format of a source.
+SNIFF_SIZE = 4 * 1024
+UTF8_BOM = b'\xef\xbb\xbf'
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+# Number of characters read at once while streaming JSON files.
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Files of newline delimited JSON larger than this are
+# parsed in parallel.
+NDJSON_PARALLEL_THRESHOLD = 8 * 1024 * 1024
+# Number of byte ranges handed to each worker process.
+RANGES_PER_PROCESS = 4
+
+# Number of rows fetched at once from SQLite databases.
+SQLITE_BATCH_SIZE = 10000
+
+# Number of characters used to determine the dialect of csv data.
+CSV_SAMPLE_SIZE = 64 * 1024
+# Csv files larger than this are parsed in parallel.
+CSV_PARALLEL_THRESHOLD = 8 * 1024 * 1024
+# Dialect attributes handed to the worker processes.
+CSV_DIALECT_PARAMS = ('delimiter', 'quotechar', 'doublequote', 'escapechar',
+                      'skipinitialspace', 'quoting', 'lineterminator')
+# Number of bytes scanned at once while searching record boundaries.
+SCAN_BLOCK_SIZE = 1024 * 1024
+# Maximum number of csv files whose dialect is remembered.
+CSV_DIALECT_CACHE_SIZE = 128
+_csv_dialect_cache = OrderedDict()
+
+# Column types inferred while reading csv data.
+TYPE_INT = 'int'
+TYPE_FLOAT = 'float'
+TYPE_STRING = 'string'
+# Number of rows used to infer the type of each csv column.
+TYPE_SAMPLE_SIZE = 100
+# Integral floats beyond this bound are not exactly representable.
+_MAX_EXACT_FLOAT = 2.0 ** 53
+# First characters of strings that may represent a number.
+_NUMBER_PREFIXES = frozenset('0123456789+-. \t\r\nnNiI')
+
+
+def load_input_source(input_source, dataformat=None, processes=None,
+                      query=None, declared_types=None):
     """Load data from an arbitrary input source. Currently supported:
-	JSON, JSON-String, CSV, CSV-String. Returns an empty list if no data
-	is available."""
+	JSON, JSON-String, NDJSON, NDJSON-String, CSV, CSV-String and the
+	result of a query on a SQLite database. The format is detected from
+	the source unless it is given explicitly. Large NDJSON and CSV files
+	are parsed by up to processes worker processes. CSV columns named in
+	the declared_types mapping are converted to their declared type
+	without inference. Returns an empty list if no data is available.
+	Errors of SQLite databases and queries are raised as ValueError."""
+    if not isinstance(input_source, str):
+        return []
+
+    from_file = is_file_source(input_source)
+    if dataformat is None:
+        dataformat = detect_format(input_source, from_file)
+
+    if dataformat == FORMAT_CSV and not from_file and '\n' not in input_source:
+        # A single line holds a header at most. Most likely the
+        # source is the path of a missing file.
+        return []
+
+    if dataformat == FORMAT_SQLITE:
+        if query is None:
+            raise ValueError("A query is required to read SQLite databases.")
+        try:
+            return load_sqlite_query(input_source, query)
+        except sqlite3.Error as e:
+            # Report the cause, e.g. an error in the query.
+            raise ValueError("SQLite query failed: %s" % e)
+
+    if dataformat == FORMAT_JSON:
+        loader = load_json_from_file if from_file else load_json_string
+    elif dataformat == FORMAT_NDJSON:
+        loader = load_ndjson_from_file if from_file else load_ndjson_string
+    elif dataformat == FORMAT_CSV:
+        loader = load_csv_from_file if from_file else load_csv_string
+    else:
+        raise ValueError("Unsupported data format: %s" % dataformat)
+
     input_data = []
     try:
-        input_data = load_json_from_file(input_source)
+        if dataformat == FORMAT_CSV and from_file:
+            input_data = loader(input_source, processes=processes,
+                                declared_types=declared_types)
+        elif dataformat == FORMAT_CSV:
+            input_data = loader(input_source, declared_types=declared_types)
+        elif from_file and dataformat == FORMAT_NDJSON:
+            input_data = loader(input_source, processes=processes)
+        else:
+            input_data = loader(input_source)
+    except csv.Error as e:
+        pass
     except ValueError as e:
         pass
     except IOError as e:
         pass
-    except Exception as e:
-        pass
-    else:
-        return input_data
-
-    if not input_data:
-        try:
-            input_data = load_json_string(input_source)
-        except AttributeError as e:
-            pass
-        except ValueError as e:
-            pass
-        except Exception as e:
-            pass
-
-    if not input_data:
-        try:
-            input_data = load_csv_from_file(input_source)
-        except csv.Error as e:
-            pass
-        except IOError as e:
-            pass
-        except Exception as e:
-            pass
-
-    if not input_data:
-        try:
-            input_data = load_csv_string(input_source)
-        except Exception as e:
-            pass
     return input_data
 
 
+def iter_input_source(input_source, dataformat=None, processes=None,
+                      query=None, declared_types=None):
+    """Like load_input_source, but the datapoints of JSON and NDJSON files
+	are yielded one at a time instead of being loaded at once. Other
+	sources are loaded completely."""
+    if isinstance(input_source, str) and is_file_source(input_source):
+        if dataformat is None:
+            dataformat = detect_format(input_source, True)
+        if dataformat == FORMAT_JSON:
+            return iter_json_from_file(input_source)
+        if dataformat == FORMAT_NDJSON:
+            return iter_ndjson_from_file(input_source)
+    return load_input_source(input_source, dataformat, processes, query,
+                             declared_types)
+
+
+def is_file_source(input_source):
+    """Checks if the input source names an existing file."""
+    try:
+        return '\n' not in input_source and os.path.isfile(input_source)
+    except (TypeError, ValueError):
+        return False
+
+
+def detect_format(input_source, from_file=None):
+    """Determines the format of an input source by its file extension
+	and its first bytes. At most SNIFF_SIZE bytes are read. Files named
+	'.json' are sniffed as well, since they often hold NDJSON."""
+    if from_file is None:
+        from_file = is_file_source(input_source)
+
+    if from_file:
+        root, extension = os.path.splitext(input_source.lower())
+        if extension in COMPRESSION_EXTENSIONS:
+            extension = os.path.splitext(root)[1]
+        dataformat = FORMAT_EXTENSIONS.get(extension)
+        if dataformat is not None and dataformat != FORMAT_JSON:
+            return dataformat
+        with open_source(input_source, 'rb') as fp:
+            head = fp.read(SNIFF_SIZE)
+        if dataformat == FORMAT_JSON:
+            if sniff_format(head) == FORMAT_NDJSON:
+                return FORMAT_NDJSON
+            return FORMAT_JSON
+    else:
+        head = input_source[:SNIFF_SIZE]
+    return sniff_format(head)
+
+
+def get_compression_module(path):
+    """Returns the module to decompress a file with, or None if
+    the file is not compressed. Only the magic bytes are read."""
+    with open(path, 'rb') as fp:
+        magic = fp.read(6)
+    for prefix, module in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            if module is None:
+                raise IOError("Decompression of '%s' is not supported." % path)
+            return module
+    return None
+
+
+def open_source(path, mode='r'):
+    """Opens a file for reading. Compressed files are
+    decompressed transparently while they are read."""
+    module = get_compression_module(path)
+    if module is None:
+        return open(path, mode)
+    if 'b' not in mode:
+        mode = mode.replace('r', 'rt')
+    return module.open(path, mode)
+
+
+def sniff_format(head):
+    """Determines the format from the beginning of a dataset."""
+    if isinstance(head, bytes):
+        if head.startswith(SQLITE_MAGIC):
+            return FORMAT_SQLITE
+        if head.startswith(UTF8_BOM):
+            head = head[len(UTF8_BOM):]
+        head = head.decode('utf-8', 'ignore')
+    head = head.lstrip(u'\ufeff \t\r\n')
+    if head[:1] == '{' and is_ndjson_head(head):
+        return FORMAT_NDJSON
+    if head[:1] in ('[', '{'):
+        return FORMAT_JSON
+    return FORMAT_CSV
+
+
+def is_ndjson_head(head):
+    """Checks if the first line of the head is a complete JSON
+    object followed by another one on the next line."""
+    lines = [line for line in head.split('\n', 2)[:2] if line.strip()]
+    if len(lines) < 2 or not lines[1].lstrip().startswith('{'):
+        return False
+    try:
+        json.loads(lines[0])
+    except ValueError:
+        return False
+    return True
+
+
 def load_json_from_file(json_input):
     """Load a JSON File."""
-    fp = open(json_input, 'r')
-    inpt = json.load(fp, object_pairs_hook=OrderedDict)
-    return inpt
+    return list(iter_json_from_file(json_input))
+
+
+def iter_json_from_file(json_input, chunk_size=JSON_CHUNK_SIZE):
+    """Incrementally reads a JSON file and yields its datapoints
+    one at a time as ordered dictionaries."""
+    with open_source(json_input) as fp:
+        for datapoint in iter_json_stream(fp, chunk_size):
+            yield datapoint
+
+
+def iter_json_stream(stream, chunk_size=JSON_CHUNK_SIZE):
+    """Yields the elements of a JSON array read from a text stream.
+    Only the current element and a read buffer are held in memory.
+    Documents that are not an array are decoded as a whole."""
+    decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill(buf, pos, size):
+        """Drops the consumed part of the buffer and appends a new chunk."""
+        chunk = stream.read(size)
+        return buf[pos:] + chunk, 0, not chunk
+
+    # Locate the opening bracket of the array.
+    while True:
+        pos = _skip_whitespace(buf, pos)
+        if pos < len(buf) or eof:
+            break
+        buf, pos, eof = fill(buf, pos, chunk_size)
+
+    if pos >= len(buf):
+        return
+
+    if buf[pos] != '[':
+        rest = buf[pos:] + stream.read()
+        document = decoder.decode(rest)
+        if isinstance(document, list):
+            for datapoint in document:
+                yield datapoint
+        else:
+            yield document
+        return
+
+    pos += 1
+    # True at the start of the array, None after a delimiter
+    # and False right after an element.
+    expect_element = True
+    while True:
+        pos = _skip_whitespace(buf, pos)
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of JSON array.")
+            buf, pos, eof = fill(buf, pos, chunk_size)
+            continue
+
+        char = buf[pos]
+        if char == ']' and expect_element is not None:
+            break
+        if expect_element is False:
+            if char != ',':
+                raise ValueError("Expecting ',' delimiter in JSON array "
+                                 "at position %d." % pos)
+            pos += 1
+            expect_element = None
+            continue
+
+        try:
+            datapoint, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            # The element is not complete yet. Grow the buffer
+            # geometrically to avoid decoding large elements too often.
+            buf, pos, eof = fill(buf, pos, max(chunk_size, len(buf)))
+            continue
+
+        # Numbers and literals may continue in the next chunk.
+        if end >= len(buf) and not eof:
+            buf, pos, eof = fill(buf, pos, max(chunk_size, len(buf)))
+            continue
+
+        yield datapoint
+        pos = end
+        expect_element = False
+
+    # Like json.load, reject anything but whitespace after the array.
+    pos += 1
+    while True:
+        pos = _skip_whitespace(buf, pos)
+        if pos < len(buf):
+            raise ValueError("Extra data after JSON array.")
+        if eof:
+            return
+        buf, pos, eof = fill(buf, pos, chunk_size)
+
+
+def _skip_whitespace(buf, pos):
+    """Returns the position of the next non-whitespace character."""
+    length = len(buf)
+    while pos < length and buf[pos] in ' \t\n\r':
+        pos += 1
+    return pos
 
 
 def load_json_string(json_input):
@@ -85,68 +384,558 @@ def load_json_string(json_input):
     return inpt
 
 
-def load_csv_string(csv_input):
+def load_ndjson_string(ndjson_input):
+    """Load a string of newline delimited JSON."""
+    return parse_ndjson_lines(ndjson_input.split('\n'))
+
+
+def load_ndjson_from_file(ndjson_input, processes=None):
+    """Loads a file of newline delimited JSON. Large files are split into
+	byte ranges at line boundaries, which are parsed by a pool of
+	processes. Their datapoints are returned as ShapedRows, which keeps
+	the keysets interned by the workers for the validation. The
+	datapoints keep the order of the file."""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    size = os.path.getsize(ndjson_input)
+
+    if (processes < 2 or size < NDJSON_PARALLEL_THRESHOLD or
+            get_compression_module(ndjson_input) is not None):
+        with open_source(ndjson_input) as fp:
+            return parse_ndjson_lines(fp)
+
+    ranges = split_file_at_lines(ndjson_input, processes * RANGES_PER_PROCESS)
+    data = ShapedRows()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for keysets, counts, rows in executor.map(_parse_ndjson_range,
+                                                  [(ndjson_input, start, end)
+                                                   for start, end in ranges]):
+            data.extend(keysets, counts, rows)
+    return data
+
+
+class ShapedRows(object):
+    """Datapoints stored as (shape id, values) pairs. The shape id indexes
+	the keyset of a datapoint in keysets, counts holds the number of
+	datapoints of each shape."""
+
+    def __init__(self):
+        self.keysets = []
+        self.counts = []
+        self.rows = []
+        self.__shapes = {}
+
+    def extend(self, keysets, counts, rows):
+        """Appends rows whose shape ids index the given keysets."""
+        mapping = []
+        for keyset, count in zip(keysets, counts):
+            shape = self.__shapes.get(keyset)
+            if shape is None:
+                shape = self.__shapes[keyset] = len(self.keysets)
+                self.keysets.append(keyset)
+                self.counts.append(0)
+            self.counts[shape] += count
+            mapping.append(shape)
+
+        if mapping == list(range(len(mapping))):
+            self.rows.extend(rows)
+        else:
+            self.rows.extend((mapping[shape], values)
+                             for shape, values in rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        """Yields each datapoint as ordered dictionary."""
+        keysets = self.keysets
+        for shape, values in self.rows:
+            yield OrderedDict(zip(keysets[shape], values))
+
+
+def iter_ndjson_from_file(ndjson_input):
+    """Yields the datapoints of a file of newline
+	delimited JSON one at a time."""
+    decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+    with open_source(ndjson_input) as fp:
+        for line in fp:
+            if line.strip():
+                yield decoder.decode(line)
+
+
+def parse_ndjson_lines(lines):
+    """Decodes each non-empty line into an ordered dictionary."""
+    decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+    return [decoder.decode(line) for line in lines if line.strip()]
+
+
+def split_file_at_lines(path, count):
+    """Splits a file into at most count byte ranges. Each range
+	starts at the beginning of a line."""
+    size = os.path.getsize(path)
+    offsets = [0]
+    with open(path, 'rb') as fp:
+        for i in range(1, count):
+            target = size * i // count
+            if target <= offsets[-1]:
+                continue
+            # Move the boundary past the line the target is in.
+            fp.seek(target - 1)
+            fp.readline()
+            offset = fp.tell()
+            if offset >= size:
+                break
+            if offset > offsets[-1]:
+                offsets.append(offset)
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+
+def _parse_ndjson_range(job):
+    """Worker function: parses the lines of a byte range of a file.
+	To keep the transfer between the processes cheap, the keysets and
+	their counts are returned once and each datapoint as a tuple of
+	its values tagged with the id of its keyset."""
+    path, start, end = job
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        chunk = fp.read(end - start)
+    if start == 0 and chunk.startswith(UTF8_BOM):
+        chunk = chunk[len(UTF8_BOM):]
+
+    shapes = {}
+    keysets = []
+    counts = []
+    rows = []
+    for datapoint in parse_ndjson_lines(chunk.decode('utf-8').split('\n')):
+        keyset = tuple(datapoint.keys())
+        shape = shapes.get(keyset)
+        if shape is None:
+            shape = shapes[keyset] = len(keysets)
+            keysets.append(keyset)
+            counts.append(0)
+        counts[shape] += 1
+        rows.append((shape, tuple(datapoint.values())))
+    return keysets, counts, rows
+
+
+def load_sqlite_query(database, query, parameters=(),
+                      batch_size=SQLITE_BATCH_SIZE):
+    """Loads the result of a query on a SQLite database into a dataset.
+	Rows are fetched in batches and stored column by column. SQLite
+	returns typed values, so no type inference is necessary. The
+	database is opened read-only, a missing file is not created."""
+    uri = Path(os.path.abspath(database)).as_uri()
+    connection = sqlite3.connect('%s?mode=ro' % uri, uri=True)
+    try:
+        cursor = connection.execute(query, parameters)
+        if cursor.description is None:
+            return []
+        header = [description[0] for description in cursor.description]
+        columns = [[] for i in header]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+    finally:
+        connection.close()
+    return _create_dataset(header, [compact_column(column)
+                                    for column in columns])
+
+
+def load_csv_string(csv_input, sample_size=CSV_SAMPLE_SIZE,
+                    declared_types=None):
     """Load a CSV-String."""
     inputstring = csv_input.split('\n')
-    data = []
-    dialect = csv.Sniffer().sniff(csv_input)
-    delimiterchar = dialect.delimiter
-    inputdata = csv.DictReader(inputstring)
-    header = inputdata.fieldnames
+    dialect = sniff_csv_dialect(csv_input[:sample_size])
+    return read_csv_dataset(csv.reader(inputstring, dialect=dialect),
+                            declared_types=declared_types)
+
+
+def load_csv_from_file(csv_input, sample_size=CSV_SAMPLE_SIZE, processes=None,
+                       declared_types=None):
+    """Loads the input from a csv file and returns a dataset for further
+	processing. The dialect is determined from the first sample_size
+	characters, the file itself is read only once. Large files are split
+	at record boundaries and parsed by a pool of processes. Columns with
+	declared types are converted without inference."""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    with open_source(csv_input) as csvfile:
+        dialect = get_csv_file_dialect(csv_input, csvfile, sample_size)
+        # Opens the input file with the determined delimiter.
+        csvreader = csv.reader(csvfile, dialect=dialect)
+
+        # Escaped quotes would break the record boundary detection.
+        if (processes < 2 or dialect.escapechar or
+                os.path.getsize(csv_input) < CSV_PARALLEL_THRESHOLD or
+                get_compression_module(csv_input) is not None):
+            return read_csv_dataset(csvreader, declared_types=declared_types)
+
+        header = read_csv_header(csvreader)
+        if header is None:
+            return []
+        if declared_types is None:
+            sample = read_csv_sample(csvreader, len(header))
+
+    if declared_types is None:
+        if not sample:
+            return []
+        column_types = [infer_column_type(column) for column in zip(*sample)]
+    else:
+        column_types = [declared_types.get(name, TYPE_STRING)
+                        for name in header]
+
+    params = dict((name, getattr(dialect, name)) for name in CSV_DIALECT_PARAMS)
+    ranges = split_csv_at_records(csv_input,
+                                  processes * RANGES_PER_PROCESS,
+                                  dialect.quotechar or '"')
+    jobs = [(csv_input, start, end, params, len(header), column_types,
+             declared_types is not None)
+            for start, end in ranges]
+
+    chunks = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for chunk in executor.map(_parse_csv_range, jobs):
+            if chunk:
+                chunks.append(chunk)
+
+    columns = [merge_column_chunks([chunk[i] for chunk in chunks])
+               for i in range(len(header))]
+    return _create_dataset(header, columns)
+
+
+def read_csv_dataset(csvreader, sample_size=TYPE_SAMPLE_SIZE,
+                     declared_types=None):
+    """Translates the rows of a csv reader into a dataset. The first row
+	is the header. The value types are inferred once per column from
+	the first sample_size rows, unless they are declared by name in the
+	declared_types mapping. Undeclared columns are read as strings."""
+    header = read_csv_header(csvreader)
+    if header is None:
+        return []
+
+    width = len(header)
+    if declared_types is None:
+        sample = read_csv_sample(csvreader, width, sample_size)
+        converters = [_COLUMN_CONVERTERS[infer_column_type(column)]
+                      for column in zip(*sample)]
+    else:
+        sample = []
+        converters = [_DECLARED_CONVERTERS[declared_types.get(name,
+                                                              TYPE_STRING)]
+                      for name in header]
+
+    columns = convert_csv_rows(sample, converters, width)
+    columns = convert_csv_rows(csvreader, converters, width, columns)
+    columns = [compact_column(column) for column in columns]
+    return _create_dataset(header, columns)
+
+
+def read_csv_header(csvreader):
+    """Returns the first non-empty row of a csv reader."""
+    for row in csvreader:
+        if row:
+            return row
+    return None
+
+
+def read_csv_sample(csvreader, width, sample_size=TYPE_SAMPLE_SIZE):
+    """Reads the next sample_size non-empty rows of a csv reader
+	and fits them to the given width."""
+    sample = []
+    for row in csvreader:
+        if row:
+            sample.append(_fit_row(row, width))
+            if len(sample) >= sample_size:
+                break
+    return sample
+
+
+def convert_csv_rows(rows, converters, width, columns=None):
+    """Converts csv rows column by column and appends the values
+	to a list for each column."""
+    if columns is None:
+        columns = [[] for i in range(width)]
+    appenders = [column.append for column in columns]
+    for row in rows:
+        if not row:
+            continue
+        for append, convert, value in zip(appenders, converters,
+                                          _fit_row(row, width)):
+            append(convert(value))
+    return columns
+
+
+def _fit_row(row, width):
+    """Fills missing values of a short row with None."""
+    if len(row) < width:
+        return row + [None] * (width - len(row))
+    return row
+
+
+def _create_dataset(header, columns):
+    """Creates a typed dataset from a header and its compacted columns.
+	Like a dictionary, duplicate column names keep their first position
+	and the values of the last column."""
+    positions = OrderedDict()
+    for i, name in enumerate(header):
+        positions[name] = i
+    keys = list(positions.keys())
+    return Dataset(keys,
+                   [columns[positions[key]][0] for key in keys],
+                   [columns[positions[key]][1] for key in keys],
+                   typed=True,
+                   masks=[columns[positions[key]][2] for key in keys])
+
+
+def split_csv_at_records(path, count, quotechar='"'):
+    """Splits the records following the header of a csv file into at
+	most count byte ranges, each starting at the beginning of a record.
+	Newlines within quoted values are tracked by the parity of the
+	quote characters."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    quote = quotechar.encode('utf-8')
+
+    with open(path, 'rb') as fp:
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # Skip leading empty lines and the header.
+            position = 0
+            while position < size:
+                start = position
+                position = _find_unquoted_newline(data, position, size,
+                                                  quote, False)[0]
+                if data[start:position].strip():
+                    break
+
+            first = position
+            offsets = [first]
+            quoted = False
+            for i in range(1, count):
+                target = first + (size - first) * i // count
+                if target <= position:
+                    continue
+                quoted ^= _has_odd_count(data, quote, position, target)
+                position, quoted = _find_unquoted_newline(data, target, size,
+                                                          quote, quoted)
+                if position >= size:
+                    break
+                offsets.append(position)
+        finally:
+            data.close()
+
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets[:-1], offsets[1:])
+            if end > start]
+
+
+def _find_unquoted_newline(data, position, size, quote, quoted):
+    """Returns the offset after the next newline outside of quotes and
+	whether that offset is quoted. Returns size if there is none."""
+    while True:
+        newline = data.find(b'\n', position)
+        if newline < 0:
+            return size, quoted
+        quoted ^= _has_odd_count(data, quote, position, newline)
+        position = newline + 1
+        if not quoted:
+            return position, quoted
+
+
+def _has_odd_count(data, quote, start, end):
+    """Checks if a byte range contains an odd number of quotes."""
+    count = 0
+    while start < end:
+        stop = min(end, start + SCAN_BLOCK_SIZE)
+        count += data[start:stop].count(quote)
+        start = stop
+    return count % 2 == 1
+
+
+def _parse_csv_range(job):
+    """Worker function: parses and converts the records in a byte range
+	of a csv file. The columns are returned in their compact form to
+	keep the transfer between the processes cheap."""
+    path, start, end, params, width, column_types, declared = job
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        chunk = fp.read(end - start).decode('utf-8')
+
+    table = _DECLARED_CONVERTERS if declared else _COLUMN_CONVERTERS
+    converters = [table[column_type] for column_type in column_types]
+    csvreader = csv.reader(io.StringIO(chunk, newline=''), **params)
+    columns = convert_csv_rows(csvreader, converters, width)
+    if not columns[0]:
+        return None
+    return [compact_column(column) for column in columns]
+
+
+def merge_column_chunks(chunks):
+    """Concatenates the compact chunks of a column in order."""
+    buffers = [chunk[0] for chunk in chunks]
+    masks = [chunk[2] for chunk in chunks]
+    typecodes = set(getattr(buf, 'typecode', None) for buf in buffers)
+    if len(typecodes) == 1 and None not in typecodes:
+        merged = array(typecodes.pop())
+        for buf in buffers:
+            merged.extend(buf)
+        return merged, chunks[0][1], merge_value_masks(buffers, masks)
+
+    merged = []
+    for buf, mask in zip(buffers, masks):
+        if mask is not None and isinstance(buf, array):
+            buf = [value if present else None
+                   for value, present in zip(buf, mask)]
+        merged.extend(buf)
+    return compact_column(merged)
+
+
+def merge_value_masks(buffers, masks):
+    """Concatenates the value masks of the chunks of a column.
+	Returns None if no chunk contains nulls."""
+    if all(mask is None for mask in masks):
+        return None
+    merged = bytearray()
+    for buf, mask in zip(buffers, masks):
+        merged.extend(bytearray(b'\x01') * len(buf) if mask is None else mask)
+    return merged
+
+
+def infer_column_type(values):
+    """Infers the type of a column from a sample of its values.
+	Returns TYPE_INT, TYPE_FLOAT or TYPE_STRING. Empty values are
+	nulls and don't affect the type unless all values are empty."""
+    column_type = None
+    for value in values:
+        if not value:
+            continue
+        if column_type is None:
+            column_type = TYPE_INT
+        value = parse_value_type(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return TYPE_STRING
+        if isinstance(value, float):
+            column_type = TYPE_FLOAT
+    return TYPE_STRING if column_type is None else column_type
+
+
+def convert_int(value):
+    """Fast path for columns of integers. Empty values are nulls."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        if not value:
+            return None
+        return parse_value_type(value)
 
-    for row in inputdata:
-        od = OrderedDict()
 
-        for item in header:
-            value = parse_value_type(row[item])
-            od[item] = value
-        data.append(od)
+def convert_float(value):
+    """Fast path for columns of floating point numbers. Integral
+	values stay floats, so the column keeps a single type, unless
+	they are beyond the exact range of floats. Empty values are nulls."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        if not value:
+            return None
+        return value
+    if number.is_integer() and not (-_MAX_EXACT_FLOAT < number <
+                                    _MAX_EXACT_FLOAT):
+        return parse_value_type(value)
+    return number
+
+
+def convert_string(value):
+    """Fast path for columns of strings. Only values that may
+	represent a number are parsed."""
+    if value and value[0] in _NUMBER_PREFIXES:
+        return parse_value_type(value)
+    return value
+
 
-    return data
+def convert_declared_int(value):
+    """Converts a value of a column declared as integer. Empty values
+	are nulls. Other values are kept, so that the schema reports the
+	column as not matching its declared type."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
 
 
-def load_csv_from_file(csv_input):
-    """Loads the input from a csv file and returns
-	a list of ordered dictionaries for further processing."""
-    data = []
-    csvfile = open(csv_input)
-    csvfile.seek(0)
-    dialect = csv.Sniffer().sniff(csvfile.read())
-    csvfile.seek(0)
-    isHeader = csv.Sniffer().has_header(csvfile.read())
-    csvfile.seek(0)
-    # The delimiter used in the dialect.
-    delimiterchar = dialect.delimiter
-    # Opens the input file with the determined delimiter.
-    dictreader = csv.DictReader(csvfile, dialect=dialect)
+def convert_declared_float(value):
+    """Converts a value of a column declared as floating point number.
+	Empty values are nulls. Other values are kept, like by
+	convert_declared_int."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
 
-    header = dictreader.fieldnames
 
-    #Translate the data into a list of dictionaries.
-    for row in dictreader:
+def convert_declared_string(value):
+    """Keeps a value of a column declared as string."""
+    return value
 
-        ordered_data = OrderedDict()
-        for item in header:
-            value = parse_value_type(row[item])
 
-            ordered_data[item] = value
+def get_csv_file_dialect(csv_input, csvfile, sample_size=CSV_SAMPLE_SIZE):
+    """Returns the dialect of a csv file. Dialects are cached by
+	path, modification time and size of the file. The file
+	position of csvfile is reset to the beginning."""
+    stat = os.stat(csv_input)
+    key = (os.path.realpath(csv_input), stat.st_mtime, stat.st_size)
 
-        data.append(ordered_data)
-    return data
+    dialect = _csv_dialect_cache.get(key)
+    if dialect is None:
+        csvfile.seek(0)
+        sample = csvfile.read(sample_size)
+        # Don't let the sniffer see a truncated last line.
+        if len(sample) == sample_size and '\n' in sample:
+            sample = sample[:sample.rindex('\n')]
+        dialect = sniff_csv_dialect(sample)
+
+        _csv_dialect_cache[key] = dialect
+        while len(_csv_dialect_cache) > CSV_DIALECT_CACHE_SIZE:
+            _csv_dialect_cache.popitem(last=False)
+
+    csvfile.seek(0)
+    return dialect
+
+
+def sniff_csv_dialect(sample):
+    """Determines the csv dialect of a sample."""
+    return csv.Sniffer().sniff(sample)
 
 
 def parse_value_type(value):
-    if is_int(value):
-        value = int(value)
-    elif is_float(value):
-        value = float(value)
-    return value
+    """Converts a value to int or float if it represents a number."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    if number.is_integer():
+        return int(number)
+    return number
 
 
 def is_float(value):
     try:
         number = float(value)
-    except ValueError:
+    except (TypeError, ValueError):
         return False
     else:
         return True
@@ -156,7 +945,16 @@ def is_int(value):
     try:
         num_a = float(value)
         num_b = int(num_a)
-    except ValueError:
+    except (TypeError, ValueError, OverflowError):
         return False
     else:
-        return num_a == num_b
\ No newline at end of file
+        return num_a == num_b
+
+
+_COLUMN_CONVERTERS = {TYPE_INT: convert_int,
+                      TYPE_FLOAT: convert_float,
+                      TYPE_STRING: convert_string}
+
+_DECLARED_CONVERTERS = {TYPE_INT: convert_declared_int,
+                        TYPE_FLOAT: convert_declared_float,
+                        TYPE_STRING: convert_declared_string}
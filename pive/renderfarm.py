@@ -0,0 +1,255 @@
+# Copyright (c) 2014 - 2015, David Bothe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+""" The render farm renders the charts of many input sources. Jobs of
+(source, chart, settings) are read lazily from an iterable and run by
+a pool of processes. Each process keeps a warm environment, so chart
+modules, compiled templates and the config registry are loaded once
+per process. Consecutive jobs of the same source share one load. At
+most a bounded number of tasks is pending, so memory stays flat no
+matter how many jobs are queued. """
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from . import visualizationmapper as vizmapper
+from .datacache import DatasetCache
+from .environment import Environment, render_chart
+from .inputmanager import InputManager
+from .visualization import defaults as default
+
+# Number of pending tasks per worker process.
+TASKS_PER_PROCESS = 4
+# Maximum number of charts of one source rendered in one task.
+MAX_CHARTS_PER_TASK = 64
+# Settings a job may specify.
+JOB_SETTINGS = ('dataformat', 'query', 'outputpath')
+
+# The warm environment of a worker process.
+_environment = None
+
+
+class RenderFarm(object):
+    """Renders charts of many sources in a pool of processes."""
+
+    # Each chart is written to a folder named after its source within
+    # the output path, unless the job specifies its own output path.
+    # With a cache directory, the workers share a dataset cache. The
+    # remaining keyword arguments configure the input managers, which
+    # parse in a single process unless 'processes' is given, since
+    # the workers already run in parallel.
+    def __init__(self, outputpath=default.output_path, processes=None,
+                 queue_size=None, cache_directory=None, **manager_options):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if queue_size is None:
+            queue_size = processes * TASKS_PER_PROCESS
+        self.__outputpath = outputpath
+        self.__processes = processes
+        self.__queue_size = max(1, queue_size)
+        self.__cache_directory = cache_directory
+        self.__manager_options = manager_options
+
+    def run(self, jobs):
+        """Renders the jobs, each a (source, chart, settings) tuple where
+        settings is a dictionary or None. Failed jobs don't abort the
+        batch but are reported. Returns a report with the number of
+        jobs, the failures, the total time and the throughput of each
+        worker."""
+        report = {'jobs': 0, 'succeeded': 0, 'failures': [], 'workers': {}}
+        start = time.time()
+        tasks = self.__create_tasks(jobs, report)
+        initargs = (self.__manager_options, self.__cache_directory)
+
+        if self.__processes < 2:
+            _init_worker(*initargs)
+            for task in tasks:
+                _collect_result(_run_task(task), report)
+        else:
+            self.__run_parallel(tasks, initargs, report)
+
+        report['seconds'] = time.time() - start
+        for stats in report['workers'].values():
+            busy = stats['seconds']
+            stats['jobs_per_second'] = stats['jobs'] / busy if busy else None
+        return report
+
+    def __run_parallel(self, tasks, initargs, report):
+        """Runs the tasks in a pool of processes. If a worker process
+        dies, the tasks pending at that time fail and a new pool runs
+        the remaining tasks."""
+        pending = {}
+        executor = self.__create_pool(initargs)
+        try:
+            for task in tasks:
+                # Backpressure: wait for a free slot in the queue.
+                while len(pending) >= self.__queue_size:
+                    for future in wait(pending,
+                                       return_when=FIRST_COMPLETED)[0]:
+                        _collect_future(future, pending.pop(future), report)
+                try:
+                    future = executor.submit(_run_task, task)
+                except BrokenProcessPool:
+                    for future in wait(pending)[0]:
+                        _collect_future(future, pending.pop(future), report)
+                    executor.shutdown()
+                    executor = self.__create_pool(initargs)
+                    future = executor.submit(_run_task, task)
+                pending[future] = task
+            for future in wait(pending)[0]:
+                _collect_future(future, pending[future], report)
+        finally:
+            executor.shutdown()
+
+    def __create_pool(self, initargs):
+        """Starts a pool of warm worker processes."""
+        return ProcessPoolExecutor(max_workers=self.__processes,
+                                   initializer=_init_worker,
+                                   initargs=initargs)
+
+    def __create_tasks(self, jobs, report):
+        """Groups consecutive jobs of the same source into tasks of
+        (source, dataformat, query, [(index, chart, outputpath)])."""
+        task = None
+        for index, job in enumerate(jobs):
+            report['jobs'] += 1
+            try:
+                source, chart, settings = job
+                settings = dict(settings or {})
+                for name in settings:
+                    if name not in JOB_SETTINGS:
+                        raise ValueError("Unknown job setting: %s" % name)
+            except (TypeError, ValueError) as e:
+                report['failures'].append({'index': index, 'job': job,
+                                           'error': _describe(e)})
+                continue
+
+            dataformat = settings.get('dataformat')
+            query = settings.get('query')
+            outputpath = settings.get('outputpath')
+            if outputpath is None:
+                outputpath = self.__get_source_path(source)
+
+            if (task is None or task[:3] != (source, dataformat, query) or
+                    len(task[3]) >= MAX_CHARTS_PER_TASK):
+                if task is not None:
+                    yield task
+                task = (source, dataformat, query, [])
+            task[3].append((index, chart, outputpath))
+        if task is not None:
+            yield task
+
+    def __get_source_path(self, source):
+        """Returns the output folder of the charts of a source. It is
+        named after the source file and a short hash of its path, so
+        sources of the same name don't share a folder."""
+        source = str(source)
+        name = os.path.splitext(os.path.basename(source))[0]
+        if os.path.exists(source):
+            source = os.path.realpath(source)
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return os.path.join(self.__outputpath, '%s-%s' % (name, digest[:8]))
+
+
+def _init_worker(manager_options, cache_directory):
+    """Creates the warm environment of a worker process."""
+    global _environment
+    cache = None
+    if cache_directory is not None:
+        cache = DatasetCache(cache_directory)
+    # The workers are parallel already, the readers need no pools.
+    manager_options = dict(manager_options)
+    manager_options.setdefault('processes', 1)
+    _environment = Environment(InputManager(**manager_options), cache=cache)
+    # Compile the chart rules before the first job.
+    vizmapper.registry.get_rules()
+
+
+def _run_task(task):
+    """Worker function: loads a source once and renders its charts.
+    Returns the process id, the source, the time taken and a
+    (index, chart, error) tuple for each chart."""
+    source, dataformat, query, charts = task
+    start = time.time()
+    try:
+        context = _environment.load_context(source, dataformat, query)
+    except Exception as e:
+        error = _describe(e)
+        results = [(index, chart, error) for index, chart, outputpath
+                   in charts]
+    else:
+        results = []
+        for index, chart, outputpath in charts:
+            if not os.path.exists(outputpath):
+                try:
+                    os.makedirs(outputpath)
+                except OSError:
+                    # Created by another worker in the meantime.
+                    pass
+            entry = render_chart((context, chart, outputpath))
+            results.append((index, chart, entry['error']))
+    return os.getpid(), source, time.time() - start, results
+
+
+def _collect_result(result, report):
+    """Adds the result of a task to the report."""
+    pid, source, seconds, results = result
+    stats = report['workers'].setdefault(pid, {'tasks': 0, 'jobs': 0,
+                                               'failed': 0, 'seconds': 0.0})
+    stats['tasks'] += 1
+    stats['seconds'] += seconds
+    for index, chart, error in results:
+        stats['jobs'] += 1
+        if error is None:
+            report['succeeded'] += 1
+        else:
+            stats['failed'] += 1
+            report['failures'].append({'index': index,
+                                       'job': (source, chart),
+                                       'error': error})
+
+
+def _collect_future(future, task, report):
+    """Adds the result of a finished task to the report. If the task
+    failed as a whole, e.g. because its worker process died or it
+    could not be sent to the worker, its jobs are failures."""
+    try:
+        result = future.result()
+    except Exception as e:
+        error = _describe(e)
+        for index, chart, outputpath in task[3]:
+            report['failures'].append({'index': index,
+                                       'job': (task[0], chart),
+                                       'error': error})
+    else:
+        _collect_result(result, report)
+
+
+def _describe(error):
+    """Describes an error of a job."""
+    return '%s: %s' % (type(error).__name__, error)
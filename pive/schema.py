@@ -0,0 +1,157 @@
+# Copyright (c) 2014 - 2015, David Bothe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+""" A schema declares the columns of a dataset in advance: their names,
+their types and the time column. With a schema, the values are converted
+by their declared type and the dataset is validated, profiled and mapped
+without inferring any type from the data. """
+from array import array
+from . import timeengine
+from .consistenceprofiler import TYPE_NUMBER, TYPE_STRING, TYPE_TIME
+from .dataset import Dataset, COLUMN_INT, COLUMN_FLOAT, COLUMN_OBJECT
+from .dataset import compact_column
+
+# Declared column types. They match the types of the input reader.
+SCHEMA_INT = 'int'
+SCHEMA_FLOAT = 'float'
+SCHEMA_STRING = 'string'
+
+_ROLES = {SCHEMA_INT: TYPE_NUMBER,
+          SCHEMA_FLOAT: TYPE_NUMBER,
+          SCHEMA_STRING: TYPE_STRING}
+
+TYPE_MISMATCH_ERR_MSG = "Column %r does not match its declared type %s."
+
+
+class Schema(object):
+    """The declared columns of a dataset."""
+
+    def __init__(self, columns, time_key=None):
+        """Creates a schema from a sequence of (name, type) pairs in
+        column order. Valid types are 'int', 'float' and 'string'. The
+        time column holds ISO-8601 strings if it is declared as string
+        and timestamps in milliseconds since the epoch otherwise."""
+        columns = list(columns.items() if hasattr(columns, 'items')
+                       else columns)
+        for key, column_type in columns:
+            if column_type not in _ROLES:
+                raise ValueError("Unsupported column type: %s" % column_type)
+        self.__keys = tuple(key for key, column_type in columns)
+        self.__types = tuple(column_type for key, column_type in columns)
+        if time_key is not None and time_key not in self.__keys:
+            raise ValueError("Unknown time column: %s" % time_key)
+        self.__time_key = time_key
+
+    def keys(self):
+        """Returns the declared column names in order."""
+        return self.__keys
+
+    def column_types(self):
+        """Returns the declared column types in key order."""
+        return self.__types
+
+    def time_key(self):
+        """Returns the name of the time column or None."""
+        return self.__time_key
+
+    def get_declared_types(self):
+        """Returns a dictionary of the declared type of each column."""
+        return dict(zip(self.__keys, self.__types))
+
+    def get_roles(self):
+        """Returns the visualization-types of the columns."""
+        return [TYPE_TIME if key == self.__time_key else _ROLES[column_type]
+                for key, column_type in zip(self.__keys, self.__types)]
+
+    def signature(self):
+        """Returns a hashable description of the schema."""
+        return (self.__keys, self.__types, self.__time_key)
+
+    def create_dataset(self, columns):
+        """Creates a dataset from a list of values for each declared
+        column. Raises a ValueError if a column does not match its
+        declared type."""
+        return self.__build([compact_column(column) for column in columns])
+
+    def conform(self, dataset):
+        """Returns a dataset holding the declared columns of a dataset,
+        converted to their declared type. Raises a ValueError if a column
+        is missing or does not match its declared type."""
+        available = set(dataset.keys())
+        for key in self.__keys:
+            if key not in available:
+                raise ValueError("Missing declared column: %s" % key)
+        return self.__build([(dataset.column(key), dataset.column_type(key),
+                              dataset.value_mask(key))
+                             for key in self.__keys])
+
+    def __build(self, columns):
+        """Converts compact columns to their declared types."""
+        buffers = []
+        storage_types = []
+        masks = []
+        for key, declared, column in zip(self.__keys, self.__types, columns):
+            buf, column_type, mask = column
+            if key == self.__time_key and declared == SCHEMA_STRING:
+                buf = timeengine.parse_time_column(buf)
+                if buf is None:
+                    raise ValueError(TYPE_MISMATCH_ERR_MSG % (key, 'time'))
+                column_type = COLUMN_INT
+            else:
+                buf, column_type = convert_column(key, declared, buf,
+                                                  column_type, mask)
+            buffers.append(buf)
+            storage_types.append(column_type)
+            masks.append(mask)
+
+        time_keys = () if self.__time_key is None else (self.__time_key,)
+        return Dataset(self.__keys, buffers, storage_types, typed=True,
+                       time_keys=time_keys, masks=masks)
+
+
+def convert_column(key, declared, buf, column_type, mask):
+    """Converts a compact column to its declared type. Returns
+    the buffer and the column type."""
+    if mask is not None and not any(mask):
+        # A column of nulls matches every type.
+        return buf, column_type
+    if declared == SCHEMA_STRING:
+        if column_type != COLUMN_OBJECT:
+            raise ValueError(TYPE_MISMATCH_ERR_MSG % (key, declared))
+        return buf, column_type
+    if declared == SCHEMA_INT:
+        if column_type != COLUMN_INT:
+            raise ValueError(TYPE_MISMATCH_ERR_MSG % (key, declared))
+        return buf, column_type
+    if column_type == COLUMN_FLOAT:
+        return buf, column_type
+    # Integers and mixed numbers are stored as floating point numbers.
+    try:
+        if mask is not None and column_type == COLUMN_OBJECT:
+            buf = [0 if value is None else value for value in buf]
+        return array('d', buf), COLUMN_FLOAT
+    except TypeError:
+        raise ValueError(TYPE_MISMATCH_ERR_MSG % (key, declared))
@@ -0,0 +1,201 @@
+# Copyright (c) 2014 - 2015, David Bothe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+""" The time engine detects time columns by their values and converts
+them into timestamps in milliseconds since the epoch. ISO-8601 strings
+are parsed by format plans. A plan is derived once for each distinct
+layout of the strings and then slices the fields of every string
+sharing that layout. """
+import re
+from array import array
+from itertools import islice
+from datetime import date
+from .dataset import COLUMN_INT, COLUMN_OBJECT
+
+# ISO-8601 dates and times, e.g. '2015-01-31', '2015-01-31T12:30',
+# '2015-01-31 12:30:59.123Z' or '2015-01-31T12:30:59+01:00'.
+ISO_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})'
+                         r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d+))?)?)?'
+                         r'(Z|[+-]\d{2}:?\d{2})?$')
+
+# Integer columns in these ranges are detected as epoch timestamps
+# in seconds or milliseconds if epoch detection is enabled. The
+# range covers the years 2000 to 2100.
+EPOCH_SECONDS_RANGE = (946684800, 4102444800)
+EPOCH_MILLIS_RANGE = (946684800000, 4102444800000)
+
+# Maximum number of remembered format plans.
+MAX_PLANS = 256
+
+# Number of values inspected to detect a time column.
+DETECTION_SAMPLE_SIZE = 100
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Maps every digit to '0' to determine the layout of a string.
+_LAYOUT_TABLE = dict((ord(digit), u'0') for digit in u'123456789')
+_plans = {}
+
+
+class FormatPlan(object):
+    """Parses strings sharing the layout of an ISO-8601 match by
+    slicing their fields at fixed positions."""
+    __slots__ = ('_spans', '_fraction', '_offset')
+
+    def __init__(self, match):
+        self._spans = [match.span(group) if match.group(group) else None
+                       for group in range(1, 7)]
+        self._fraction = match.span(7) if match.group(7) else None
+        self._offset = match.span(8) if match.group(8) else None
+
+    def parse(self, value):
+        """Returns the timestamp of a string in milliseconds since the
+        epoch. Times without an offset are read as UTC, unlike the
+        browser which reads them as local time. Raises a ValueError
+        if a field is out of range."""
+        fields = [int(value[span[0]:span[1]]) if span else 0
+                  for span in self._spans]
+        year, month, day, hour, minute, second = fields
+        if hour > 23 or minute > 59 or second > 59:
+            raise ValueError("Time out of range: %s" % value)
+        days = date(year, month, day).toordinal() - _EPOCH_ORDINAL
+        millis = (((days * 24 + hour) * 60 + minute) * 60 + second) * 1000
+
+        if self._fraction:
+            fraction = value[self._fraction[0]:self._fraction[1]]
+            millis += int((fraction + '00')[:3])
+        if self._offset:
+            offset = value[self._offset[0]:self._offset[1]]
+            if offset != 'Z':
+                digits = offset[1:].replace(':', '')
+                minutes = int(digits[:2]) * 60 + int(digits[2:])
+                if offset[0] == '-':
+                    minutes = -minutes
+                millis -= minutes * 60000
+        return millis
+
+
+def get_format_plan(value):
+    """Returns the format plan for the layout of a string
+    or None if it is no ISO-8601 date or time."""
+    layout = value.translate(_LAYOUT_TABLE)
+    plan = _plans.get(layout)
+    if plan is None:
+        match = ISO_PATTERN.match(value)
+        plan = FormatPlan(match) if match else False
+        if len(_plans) >= MAX_PLANS:
+            _plans.clear()
+        _plans[layout] = plan
+    return plan or None
+
+
+def parse_time(value):
+    """Returns the timestamp of an ISO-8601 string in milliseconds
+    since the epoch or None if the string is no valid time."""
+    plan = get_format_plan(value)
+    if plan is None:
+        return None
+    try:
+        return plan.parse(value)
+    except ValueError:
+        return None
+
+
+def is_time_string(value):
+    """Checks if a value is an ISO-8601 string."""
+    return isinstance(value, str) and parse_time(value) is not None
+
+
+def parse_time_column(column):
+    """Converts a column of ISO-8601 strings into an array of timestamps.
+    Nulls are held as zero. Returns None if any other value is no valid
+    time."""
+    timestamps = array('q')
+    append = timestamps.append
+    plans = _plans
+    translate = _LAYOUT_TABLE
+    try:
+        for value in column:
+            if value is None:
+                append(0)
+                continue
+            plan = plans.get(value.translate(translate))
+            if not plan:
+                plan = get_format_plan(value)
+                if plan is None:
+                    return None
+            append(plan.parse(value))
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        return None
+    return timestamps
+
+
+def is_epoch_column(values):
+    """Checks if all values of an integer column lie in the
+    range of epoch timestamps in seconds or milliseconds."""
+    values = list(values)
+    if not values:
+        return False
+    low = min(values)
+    high = max(values)
+    for start, end in (EPOCH_SECONDS_RANGE, EPOCH_MILLIS_RANGE):
+        if start <= low and high < end:
+            return True
+    return False
+
+
+def epoch_to_millis(column):
+    """Converts an integer column of epoch timestamps to milliseconds."""
+    if max(column) < EPOCH_SECONDS_RANGE[1]:
+        return array('q', [value * 1000 for value in column])
+    return column
+
+
+def convert_time_columns(dataset, epoch=False,
+                         sample_size=DETECTION_SAMPLE_SIZE):
+    """Detects the time columns of a dataset by their values and returns a
+    dataset in which they are replaced by timestamps in milliseconds since
+    the epoch. Columns of ISO-8601 strings are always converted, integer
+    columns of epoch timestamps only if epoch is true. Times without an
+    offset are read as UTC. Nulls are kept."""
+    replacements = {}
+    for key, column_type in zip(dataset.keys(), dataset.column_types()):
+        column = dataset.column(key)
+        mask = dataset.value_mask(key)
+        if column_type == COLUMN_OBJECT:
+            sample = list(islice(dataset.present_values(key), sample_size))
+            if not sample or not all(is_time_string(value)
+                                     for value in sample):
+                continue
+            timestamps = parse_time_column(column)
+            if timestamps is not None:
+                replacements[key] = (timestamps, COLUMN_INT, mask)
+        elif (epoch and column_type == COLUMN_INT and
+              is_epoch_column(dataset.present_values(key))):
+            replacements[key] = (epoch_to_millis(column), COLUMN_INT, mask)
+
+    if not replacements:
+        return dataset
+    return dataset.replace_columns(replacements, replacements.keys())
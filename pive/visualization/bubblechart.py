@@ -23,11 +23,11 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-import jinja2
 import os
 import json
 from pive.visualization import defaults as default
 from pive.visualization import basevisualization as bv
+from pive.visualization import templateloader
 from pive.visualization import viewportvisualization as vv
 from pive.visualization import customscalesvisualization as csv
 
@@ -295,13 +295,9 @@ class Chart(bv.BaseVisualization, csv.CustomScalesVisualization, vv.ViewportVisu
         self.set_height(height)
 
     def load_template_file(self, template_url):
-        templateLoader = jinja2.FileSystemLoader(searchpath=[default.template_path, '/'])
         print ("Opening template: %s" % (template_url))
-
-        templateEnv = jinja2.Environment(loader=templateLoader)
-        TEMPLATE_FILE = template_url
-        template = templateEnv.get_template(TEMPLATE_FILE)
-        return template
+        # Templates are compiled once and shared by all charts.
+        return templateloader.get_template(template_url)
 
 	
 
@@ -24,9 +24,13 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import json
+import threading
+import time
+from bisect import bisect_right
 from glob import glob
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 from .visualization import defaults as default
+from .dataset import Dataset
 import os
 
 config_path = default.config_path
@@ -34,18 +38,228 @@ config_path = default.config_path
 realpath = os.path.dirname(os.path.realpath(__file__))
 internal_config_path = '%s%s' % (realpath, config_path)
 
+# The result of the monotonicity analysis. The strict directions are
+# ascending and descending, the non-strict ones allow equal neighbours.
+Monotonicity = namedtuple('Monotonicity', ['ascending', 'descending',
+                                           'non_decreasing', 'non_increasing',
+                                           'sortedness'])
+
+# Minimum number of seconds between two checks
+# of the config files for modifications.
+CONFIG_CHECK_INTERVAL = 1.0
+
+# Maximum number of memoized dataset signatures.
+SUITABILITY_MEMO_SIZE = 1024
+
 
 def open_config_files(default_config_path):
     """Opens all json-config files in a directory and
     returns a list of each files content."""
     configs = []
     for filename in glob(internal_config_path + '*.json'):
-        fp = open(filename, 'r')
-        conf = json.load(fp, object_pairs_hook=OrderedDict)
+        with open(filename, 'r') as fp:
+            conf = json.load(fp, object_pairs_hook=OrderedDict)
         configs.append(conf)
     return configs
 
 
+class ChartRule(object):
+    """The requirements of a visualization config compiled into a
+    predicate on the dataset properties."""
+
+    def __init__(self, config):
+        self.title = config['title']
+        self.min_datapoints = None
+        self.max_datapoints = None
+        self.requires_lexical = False
+        self.supports_dates = True
+        self.supports_multi_data = False
+        self.required_types = None
+
+        for elem in config.keys():
+            if elem == 'min_datapoints':
+                self.min_datapoints = config[elem]
+            elif elem == 'max_datapoints':
+                if config[elem] != 'inf':
+                    self.max_datapoints = config[elem]
+            elif elem == 'datesupport':
+                self.supports_dates = config[elem] == True
+            elif elem == 'multiple_data':
+                self.supports_multi_data = config[elem]
+            elif elem == 'lexical_required':
+                self.requires_lexical = config[elem] == True
+            elif elem == 'vistypes':
+                self.required_types = compile_required_types(config[elem])
+
+    def matches(self, props):
+        """Checks if the dataset properties meet the requirements."""
+        length = props[0]
+        if self.min_datapoints is not None and length < self.min_datapoints:
+            return False
+        if self.max_datapoints is not None and length > self.max_datapoints:
+            return False
+        if props[2] and not self.supports_dates:
+            return False
+        if self.requires_lexical and not props[4]:
+            return False
+        if self.required_types is None:
+            return True
+        return self.matches_types(props[3])
+
+    def matches_types(self, given_types):
+        """Checks if the visualization-types meet the required types,
+        like checkInputOrder."""
+        required = self.required_types
+        count = len(required)
+        datalength = len(given_types)
+        if datalength < count:
+            return False
+        if datalength > count and not self.supports_multi_data:
+            return False
+        if count > 1 and (datalength - 1) % (count - 1) != 0:
+            return False
+        for given, options in zip(given_types, required):
+            if given not in options:
+                return False
+        return True
+
+
+def compile_required_types(vistypes):
+    """Returns a tuple with the options for each required type."""
+    required = []
+    for vistype in vistypes:
+        for key in vistype:
+            options = vistype[key]
+            if isinstance(options, list):
+                required.append(tuple(options))
+            else:
+                required.append((options,))
+    return tuple(required)
+
+
+class RuleRegistry(object):
+    """Loads the visualization configs once and keeps them as compiled
+    chart rules. The configs are reloaded if a file was added, removed
+    or modified, which is checked at most every check_interval seconds."""
+
+    def __init__(self, directory=internal_config_path,
+                 check_interval=CONFIG_CHECK_INTERVAL):
+        self.__directory = directory
+        self.__check_interval = check_interval
+        self.__rules = None
+        self.__signature = None
+        self.__checked = 0
+        self.__lock = threading.Lock()
+
+    def get_rules(self):
+        """Returns the compiled chart rules, reloading
+        them if the configs were modified."""
+        now = time.time()
+        rules = self.__rules
+        if rules is not None and now - self.__checked < self.__check_interval:
+            return rules
+        with self.__lock:
+            signature = self.__get_signature()
+            if signature != self.__signature:
+                self.__rules = self.__load_rules(signature)
+                self.__signature = signature
+            self.__checked = now
+        return self.__rules
+
+    def reload(self):
+        """Forces the configs to be read again with the next call."""
+        self.__rules = None
+        self.__signature = None
+
+    def __get_signature(self):
+        """Returns the names and modification times of the config files."""
+        signature = []
+        for filename in glob(self.__directory + '*.json'):
+            try:
+                signature.append((filename, os.path.getmtime(filename)))
+            except OSError:
+                pass
+        return tuple(signature)
+
+    def __load_rules(self, signature):
+        """Reads and compiles the config files."""
+        rules = []
+        for filename, mtime in signature:
+            with open(filename, 'r') as fp:
+                config = json.load(fp, object_pairs_hook=OrderedDict)
+            rules.append(ChartRule(config))
+        return rules
+
+
+def get_length_cuts(rules):
+    """Returns the sorted lengths at which the result of any rule may
+    change. Lengths between two cuts are treated alike by all rules."""
+    cuts = set()
+    for rule in rules:
+        if rule.min_datapoints is not None:
+            cuts.add(rule.min_datapoints)
+        if rule.max_datapoints is not None:
+            cuts.add(rule.max_datapoints + 1)
+    return sorted(cuts)
+
+
+class SuitabilityMemo(object):
+    """Memoizes the suitable visualizations of a dataset by its signature:
+    the visualization-types, the length bucket between the length limits
+    of the rules, the date support and the lexicographic order. The memo
+    is a bounded LRU and is cleared when the rules are reloaded."""
+
+    def __init__(self, rule_registry, max_size=SUITABILITY_MEMO_SIZE):
+        self.__registry = rule_registry
+        self.__max_size = max_size
+        self.__entries = OrderedDict()
+        self.__rules = None
+        self.__cuts = []
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_suitables(self, props):
+        """Returns the suitable visualizations for the dataset
+        properties, evaluating the rules once per signature."""
+        rules = self.__registry.get_rules()
+        with self.__lock:
+            if rules is not self.__rules:
+                self.__entries.clear()
+                self.__rules = rules
+                self.__cuts = get_length_cuts(rules)
+            signature = (tuple(props[3]), bisect_right(self.__cuts, props[0]),
+                         bool(props[2]), bool(props[4]))
+            suitables = self.__entries.pop(signature, None)
+            if suitables is None:
+                self.misses += 1
+                suitables = [rule.title for rule in rules
+                             if rule.matches(props)]
+            else:
+                self.hits += 1
+            # Mark the signature as recently used.
+            self.__entries[signature] = suitables
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+        return list(suitables)
+
+    def clear(self):
+        """Removes all signatures and resets the counters."""
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+# The registry of the internal visualization configs.
+registry = RuleRegistry()
+# The memo of the suitable visualizations by dataset signature.
+suitability_memo = SuitabilityMemo(registry)
+
+
 def has_date(viz_types):
     """Checks if the datapoint has dates."""
     times = False
@@ -69,7 +283,7 @@ def get_visualization_properties(dataset, viz_types):
     props.append(viz_types)
 
     # Indicates, if the abcissa of the dataset is in lexicographic order.
-    if (viz_types[0] in ('number', 'time')) and length > 1:
+    if viz_types and (viz_types[0] in ('number', 'time')) and length > 1:
         lexicographic = is_data_in_lexicographic_order(dataset)
     else:
         lexicographic = False
@@ -106,88 +320,81 @@ def is_multiple_data_consistent(given_types, singleDataLength):
     return consistent
 
 
+def get_abscissa_values(dataset):
+    """Returns an iterable over the abscissa of
+    each datapoint, skipping nulls."""
+    if isinstance(dataset, Dataset):
+        return dataset.present_values(dataset.keys()[0])
+    abscissae = (next(iter(item.values())) for item in dataset)
+    return (abscissa for abscissa in abscissae if abscissa is not None)
+
+
+def analyze_monotonicity(values, sortedness=False):
+    """Analyses the order of the values in a single pass. The pass stops
+    as soon as both directions are ruled out, unless the sortedness is
+    requested. The sortedness is the fraction of adjacent pairs that
+    follow the prevailing direction, 1.0 for sorted values."""
+    ascending = descending = non_decreasing = non_increasing = True
+    rising = falling = pairs = 0
+    values = iter(values)
+    for previous in values:
+        break
+    try:
+        for current in values:
+            pairs += 1
+            if current > previous:
+                descending = non_increasing = False
+                rising += 1
+            elif current < previous:
+                ascending = non_decreasing = False
+                falling += 1
+            else:
+                ascending = descending = False
+            if not (non_decreasing or non_increasing or sortedness):
+                break
+            previous = current
+    except TypeError:
+        # Values that cannot be compared, e.g. left over by a sampled
+        # consistency check, have no order.
+        return Monotonicity(False, False, False, False,
+                            0.0 if sortedness else None)
+
+    fraction = None
+    if sortedness:
+        fraction = 1.0
+        if pairs:
+            fraction = (pairs - min(rising, falling)) / float(pairs)
+    return Monotonicity(ascending, descending, non_decreasing,
+                        non_increasing, fraction)
+
+
+def get_abscissa_order(dataset, sortedness=False):
+    """Analyses the order of the abscissa of the dataset."""
+    return analyze_monotonicity(get_abscissa_values(dataset), sortedness)
+
+
 def is_data_value_ascending(dataset):
     """Checks if the data is ascending."""
-    ascending = True
-    starting_abscissa = list((dataset[0]).items())[0][1]
-    last_abscissa = starting_abscissa
-    for item in dataset[1:]:
-        current_abscisssa = list(item.items())[0]
-        if (current_abscisssa[1] <= last_abscissa):
-            ascending = False
-        last_abscissa = current_abscisssa[1]
-    return ascending
+    return get_abscissa_order(dataset).ascending
 
 
 def is_data_value_descending(dataset):
     """Checks if the data ist descending."""
-    descending = True
-    starting_abscissa = list((dataset[0]).items())[0][1]
-    last_abscissa = starting_abscissa
-    for item in dataset[1:]:
-        current_abscisssa = list(item.items())[0]
-        if (current_abscisssa[1] >= last_abscissa):
-            descending = False
-        last_abscissa = current_abscisssa[1]
-    return descending
+    return get_abscissa_order(dataset).descending
 
 
 def is_data_in_lexicographic_order(dataset):
     """Checks if the data is ascending or descending."""
-    lexicographic = True
-    if not (is_data_value_descending(dataset) or is_data_value_ascending(dataset)):
-        lexicographic = False
-    return lexicographic
+    order = get_abscissa_order(dataset)
+    return order.ascending or order.descending
 
 
 def check_possibilities(property_list):
     """Checks if the input data maps to any of
     the visualization configs and returns a resultlist
-    with the supported charts."""
-    result = []
-    props = property_list
-    conf = open_config_files(config_path)
-
-    for item in conf:
-        item_type = item['title']
-        is_possible = True
-        supports_multi_data = False
-
-        for elem in item.keys():
-            # The dataset should contain at
-            # least the minimum required datapoints.
-            if elem == 'min_datapoints':
-                if props[0] < item[elem]:
-                    is_possible = False
-            #The dataset should not contain more
-            #than the maximum number off supported
-            #datapoints.
-            if elem == 'max_datapoints':
-                if item[elem] != 'inf':
-                    if (props[0] > item[elem]):
-                        is_possible = False
-
-            #If the data contains a date, the visualization
-            #has to support date-types.
-            if elem == 'datesupport':
-                if props[2]:
-                    if item[elem] != props[2]:
-                        is_possible = False
-            if elem == 'multiple_data':
-                supports_multi_data = item[elem]
-
-            if elem == 'lexical_required':
-                if item[elem] == True:
-                    if not props[4]:
-                        is_possible = False
-
-            #Checks if the input order of the desired viz-types matches
-            #the requirements.
-            if ((elem == 'vistypes') and is_possible):
-                is_possible = checkInputOrder(elem, item, props, supports_multi_data)
-        if is_possible:
-            result.append(item_type)
-    return result
+    with the supported charts. Results are memoized
+    by the signature of the dataset."""
+    return suitability_memo.get_suitables(property_list)
 
 
 def checkInputOrder(elem, item, props, supportsMultiData):
@@ -3,7 +3,6 @@ from setuptools import setup, find_packages
 setup(
     name='pive',
     packages=['pive', 'pive/visualization'],
-    use_2to3=True,
     include_package_data=True,
     version='0.3.3',
     url='https://github.com/daboth/pive',
@@ -24,6 +23,7 @@ setup(
         'Topic :: Scientific/Engineering :: Visualization',
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
+    python_requires='>=3.4',
     install_requires=['jinja2']
 
 )
\ No newline at end of file